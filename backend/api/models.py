@@ -1,18 +1,21 @@
 """
 API Request/Response Models
+
+msgspec structs used on the request path; see schemas.py for the
+OpenAPI (pydantic) copies.
 """
 
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+import msgspec
+from typing import List, Optional
 
 
-class QueryRequest(BaseModel):
+class QueryRequest(msgspec.Struct):
     """Request model for query endpoint"""
     query: str
     verbose: bool = False
 
 
-class SourceResponse(BaseModel):
+class SourceResponse(msgspec.Struct, omit_defaults=True):
     """Source information in response"""
     substance_name: str
     section_name: str
@@ -20,7 +23,7 @@ class SourceResponse(BaseModel):
     cross_encoder_score: Optional[float] = None
 
 
-class TimingResponse(BaseModel):
+class TimingResponse(msgspec.Struct, omit_defaults=True):
     """Timing information in response"""
     total: float
     vector_search: Optional[float] = None
@@ -28,7 +31,7 @@ class TimingResponse(BaseModel):
     llm_generation: Optional[float] = None
 
 
-class QueryResponse(BaseModel):
+class QueryResponse(msgspec.Struct, omit_defaults=True):
     """Response model for query endpoint"""
     answer: str
     sources: List[SourceResponse]
@@ -36,8 +39,7 @@ class QueryResponse(BaseModel):
     error: Optional[str] = None
 
 
-class HealthResponse(BaseModel):
+class HealthResponse(msgspec.Struct):
     """Response model for health check"""
     status: str
     message: str
-
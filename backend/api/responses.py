@@ -0,0 +1,32 @@
+"""
+API Response Classes
+"""
+
+from typing import Any
+import msgspec
+import orjson
+from fastapi.responses import JSONResponse, Response
+
+
+def _default(obj: Any) -> Any:
+    """Fallback serializer for types orjson does not handle natively"""
+    if hasattr(obj, 'tolist'):
+        # numpy scalars/arrays coming out of the ranker
+        return obj.tolist()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson (skips jsonable_encoder)"""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class MsgspecResponse(Response):
+    """JSON response for msgspec structs, encoded straight to bytes"""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return msgspec.json.encode(content)
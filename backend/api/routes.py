@@ -5,8 +5,10 @@ API Routes
 import sys
 import os
 import logging
-from fastapi import APIRouter, HTTPException
-from typing import Dict
+import msgspec
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from typing import TYPE_CHECKING, Dict
 
 # Add parent directory to path to import existing modules
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -15,58 +17,73 @@ if project_root not in sys.path:
 
 # Import from backend package
 from backend.api.models import QueryRequest, QueryResponse, SourceResponse, TimingResponse, HealthResponse
-# Import from core package
-from core.query_pipeline import QueryPipeline
+from backend.api import schemas
+from backend.api.responses import MsgspecResponse
+# Pipeline is only needed for type hints; app.py imports it at startup
+if TYPE_CHECKING:
+    from core.query_pipeline import QueryPipeline
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 # Global pipeline instance (initialized in app.py)
-pipeline: QueryPipeline = None
+pipeline: "QueryPipeline" = None
 
 
-def set_pipeline(p: QueryPipeline):
+def set_pipeline(p: "QueryPipeline"):
     """Set the query pipeline instance"""
     global pipeline
     pipeline = p
 
 
-@router.get("/health", response_model=HealthResponse)
+@router.get("/health", responses={200: {"model": schemas.HealthResponse}})
 async def health_check():
     """Health check endpoint"""
     try:
         # Basic check - if pipeline is initialized, we're ready
         if pipeline is None:
-            return HealthResponse(
+            return MsgspecResponse(HealthResponse(
                 status="initializing",
                 message="Pipeline is being initialized"
-            )
+            ))
         
-        return HealthResponse(
+        return MsgspecResponse(HealthResponse(
             status="healthy",
             message="Backend is ready"
-        )
+        ))
     except Exception as e:
         logger.error(f"Health check failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/query", response_model=QueryResponse)
-async def process_query(request: QueryRequest):
-    """Process a user query through the pipeline"""
-    if pipeline is None:
-        raise HTTPException(
-            status_code=503,
-            detail="Pipeline is not initialized. Please wait a moment and try again."
-        )
-    
+def parse_query_request(body: bytes) -> QueryRequest:
+    """Decode and validate the raw /query body with msgspec"""
     try:
-        # Process query using existing pipeline
-        result = pipeline.process_query(request.query, verbose=request.verbose)
+        return msgspec.json.decode(body, type=QueryRequest)
+    except msgspec.ValidationError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except msgspec.DecodeError:
+        raise HTTPException(status_code=422, detail="Request body must be valid JSON")
+
+
+def build_query_response(result: Dict) -> QueryResponse:
+    """
+    Build the /query response struct from a pipeline result
+    
+    The result comes from our own QueryPipeline, so it is trusted and not
+    validated here (schemas.QueryResponse documents the same shape).
+    
+    Args:
+        result: QueryPipeline result dictionary
         
-        # Convert sources to response model
-        sources = [
+    Returns:
+        QueryResponse struct
+    """
+    timing_data = result.get('timing', {})
+    return QueryResponse(
+        answer=result.get('answer') or '',
+        sources=[
             SourceResponse(
                 substance_name=src.get('substance_name', ''),
                 section_name=src.get('section_name', ''),
@@ -74,26 +91,42 @@ async def process_query(request: QueryRequest):
                 cross_encoder_score=src.get('cross_encoder_score')
             )
             for src in result.get('sources', [])
-        ]
-        
-        # Convert timing to response model
-        timing_data = result.get('timing', {})
-        timing = TimingResponse(
+        ],
+        timing=TimingResponse(
             total=timing_data.get('total', 0.0),
             vector_search=timing_data.get('vector_search'),
             reranking=timing_data.get('reranking'),
             llm_generation=timing_data.get('llm_generation')
+        ),
+        error=result.get('error')
+    )
+
+
+@router.post(
+    "/query",
+    responses={200: {"model": schemas.QueryResponse}},
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": schemas.QueryRequest.model_json_schema()}}
+        }
+    }
+)
+async def process_query(request: Request):
+    """Process a user query through the pipeline"""
+    if pipeline is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Pipeline is not initialized. Please wait a moment and try again."
         )
+    
+    query_request = parse_query_request(await request.body())
+    
+    try:
+        # Process query using existing pipeline
+        result = await pipeline.aprocess_query(query_request.query, verbose=query_request.verbose)
         
-        # Build response
-        response = QueryResponse(
-            answer=result.get('answer', ''),
-            sources=sources,
-            timing=timing,
-            error=result.get('error')
-        )
-        
-        return response
+        return MsgspecResponse(build_query_response(result))
         
     except Exception as e:
         logger.error(f"Error processing query: {e}", exc_info=True)
@@ -102,3 +135,28 @@ async def process_query(request: QueryRequest):
             detail=f"Error processing query: {str(e)}"
         )
 
+
+@router.post(
+    "/query/stream",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": schemas.QueryRequest.model_json_schema()}}
+        }
+    }
+)
+async def stream_query(request: Request):
+    """Process a user query and stream the answer as server-sent events"""
+    if pipeline is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Pipeline is not initialized. Please wait a moment and try again."
+        )
+    
+    query_request = parse_query_request(await request.body())
+    
+    async def event_stream():
+        async for event in pipeline.astream_query(query_request.query):
+            yield b"data: " + msgspec.json.encode(event) + b"\n\n"
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
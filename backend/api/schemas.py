@@ -0,0 +1,47 @@
+"""
+API Schemas (OpenAPI only)
+
+Pydantic copies of the msgspec models in models.py. They are only used to
+publish the request/response schema in the OpenAPI docs and are never
+instantiated on the request path.
+"""
+
+from pydantic import BaseModel
+from typing import List, Optional
+
+
+class QueryRequest(BaseModel):
+    """Request model for query endpoint"""
+    query: str
+    verbose: bool = False
+
+
+class SourceResponse(BaseModel):
+    """Source information in response"""
+    substance_name: str
+    section_name: str
+    similarity_score: Optional[float] = None
+    cross_encoder_score: Optional[float] = None
+
+
+class TimingResponse(BaseModel):
+    """Timing information in response"""
+    total: float
+    vector_search: Optional[float] = None
+    reranking: Optional[float] = None
+    llm_generation: Optional[float] = None
+
+
+class QueryResponse(BaseModel):
+    """Response model for query endpoint"""
+    answer: str
+    sources: List[SourceResponse]
+    timing: TimingResponse
+    error: Optional[str] = None
+
+
+class HealthResponse(BaseModel):
+    """Response model for health check"""
+    status: str
+    message: str
+
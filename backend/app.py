@@ -5,7 +5,9 @@ Wraps the existing QueryPipeline with a REST API
 
 import sys
 import os
+import queue
 import logging
+import logging.handlers
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -14,32 +16,59 @@ project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
-from core.query_pipeline import QueryPipeline
 from backend.api.routes import router, set_pipeline
+from backend.api.responses import ORJSONResponse
 from core import config
 
-# Setup logging
-# Resolve log file path relative to project root
-log_file_path = os.path.join(project_root, config.LOG_FILE)
-log_dir = os.path.dirname(log_file_path)
-os.makedirs(log_dir, exist_ok=True)
-
-logging.basicConfig(
-    level=getattr(logging, config.LOG_LEVEL),
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_file_path),
-        logging.StreamHandler()
-    ]
-)
-
 logger = logging.getLogger(__name__)
 
+# Queue listener that writes log records (started on app startup)
+log_listener = None
+
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """
+    Route all logging through a queue drained by a background thread
+    
+    Called from startup rather than at import time: with several uvicorn
+    workers this module is imported more than once per process, and each
+    import would otherwise add its own listener and log file handle.
+    
+    Returns:
+        The started queue listener (stop it on shutdown)
+    """
+    # Resolve log file path relative to project root
+    log_file_path = os.path.join(project_root, config.LOG_FILE)
+    os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
+    
+    # Log calls only enqueue records; a background thread does the file/console I/O
+    log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    file_handler = logging.FileHandler(log_file_path)
+    file_handler.setFormatter(log_formatter)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(log_formatter)
+    
+    log_queue = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(
+        log_queue, file_handler, stream_handler, respect_handler_level=True
+    )
+    listener.start()
+    
+    logging.basicConfig(
+        level=getattr(logging, config.LOG_LEVEL),
+        handlers=[logging.handlers.QueueHandler(log_queue)],
+        force=True
+    )
+    
+    return listener
+
+
 # Create FastAPI app
 app = FastAPI(
     title="Medical Knowledge Graph Chatbot API",
     description="REST API for the Medical Knowledge Graph Chatbot",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Configure CORS
@@ -61,14 +90,19 @@ pipeline_instance = None
 @app.on_event("startup")
 async def startup_event():
     """Initialize the query pipeline on startup"""
-    global pipeline_instance
+    global pipeline_instance, log_listener
+    log_listener = setup_logging()
     logger.info("="*80)
     logger.info("INITIALIZING BACKEND API")
     logger.info("="*80)
     
     try:
         logger.info("Initializing QueryPipeline...")
+        # Imported here so the app (and /health) loads without the ML stack
+        from core.query_pipeline import QueryPipeline
         pipeline_instance = QueryPipeline()
+        # Keep-alive connection pool to Ollama, reused by every request
+        pipeline_instance.llm_generator.open_async_client()
         set_pipeline(pipeline_instance)
         logger.info("✓ Backend API ready!")
     except Exception as e:
@@ -79,30 +113,45 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
-    global pipeline_instance
+    global log_listener
     if pipeline_instance:
         logger.info("Closing pipeline connections...")
         try:
+            await pipeline_instance.aclose()
             pipeline_instance.close()
         except Exception as e:
             logger.error(f"Error during cleanup: {e}")
         logger.info("✓ Cleanup complete")
+    
+    # Flush remaining log records and stop the logging thread
+    if log_listener is not None:
+        log_listener.stop()
+        log_listener = None
 
 
 @app.get("/")
 async def root():
     """Root endpoint"""
-    return {
+    return ORJSONResponse({
         "message": "Medical Knowledge Graph Chatbot API",
         "status": "running",
         "endpoints": {
             "health": "/api/health",
-            "query": "/api/query"
+            "query": "/api/query",
+            "query_stream": "/api/query/stream"
         }
-    }
+    })
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # uvloop event loop + httptools parser; an import string is required for workers > 1
+    uvicorn.run(
+        "backend.app:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=config.API_WORKERS
+    )
 
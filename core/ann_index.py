@@ -0,0 +1,194 @@
+"""
+ANN Index Module
+In-process FAISS HNSW mirror of the Section embeddings stored in Neo4j
+
+Neo4j stays the system of record: the index is built from Section.embedding
+once, saved to disk, and only used to find the nearest node ids. Section
+metadata and entities are still read from the graph.
+"""
+
+import json
+import logging
+import os
+from typing import List, Optional, Tuple
+import numpy as np
+from .embedding_backend import PROJECT_ROOT, embedding_cache_key
+from .file_lock import file_lock
+from .quantization import l2_normalize
+from . import config
+
+try:
+    import faiss
+except ImportError:  # Optional dependency
+    faiss = None
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "sections.faiss"
+IDS_FILE = "node_ids.npy"
+META_FILE = "meta.json"
+
+EMBEDDED_COUNT_QUERY = "MATCH (sec:Section) WHERE sec.embedding IS NOT NULL RETURN count(sec) as count"
+EMBEDDINGS_QUERY = """
+MATCH (sec:Section)
+WHERE sec.embedding IS NOT NULL
+RETURN elementId(sec) as node_id, sec.embedding as embedding
+"""
+
+
+def _index_dir() -> str:
+    """Absolute directory of the saved index"""
+    return os.path.join(PROJECT_ROOT, config.ANN_INDEX_DIR)
+
+
+def remove_saved_index():
+    """Delete the saved index so the next load rebuilds it (call after re-embedding)"""
+    for file_name in (META_FILE, INDEX_FILE, IDS_FILE):
+        path = os.path.join(_index_dir(), file_name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class SectionAnnIndex:
+    """HNSW index (float32 or int8) over Section embeddings, keyed by Neo4j element id"""
+    
+    def __init__(self, index: "faiss.Index", node_ids: np.ndarray):
+        """
+        Wrap a built index
+        
+        Args:
+            index: FAISS inner-product index over unit-length embeddings
+            node_ids: Section element ids aligned with the index rows
+        """
+        self.index = index
+        self.node_ids = node_ids
+        self.index.hnsw.efSearch = config.ANN_HNSW_EF_SEARCH
+    
+    @classmethod
+    def load_or_build(cls, driver) -> Optional["SectionAnnIndex"]:
+        """
+        Load the saved index, rebuilding it from Neo4j if it is missing or stale
+        
+        The saved index is stale when the embedding model, the number of
+        embedded sections or ANN_INDEX_QUANTIZATION has changed since it
+        was built.
+        
+        Args:
+            driver: Neo4j driver
+            
+        Returns:
+            SectionAnnIndex, or None if faiss is not installed
+        """
+        if faiss is None:
+            logger.warning("⚠ faiss is not installed, using the Neo4j vector index")
+            return None
+        
+        records, _, _ = driver.execute_query(EMBEDDED_COUNT_QUERY, database_=config.NEO4J_DATABASE)
+        meta = {
+            'model': embedding_cache_key(),
+            'count': records[0]['count'],
+            'quantization': config.ANN_INDEX_QUANTIZATION
+        }
+        
+        index_dir = _index_dir()
+        
+        # API workers starting together build the index once; the others
+        # wait and load it
+        with file_lock(index_dir.rstrip(os.sep) + ".lock"):
+            try:
+                with open(os.path.join(index_dir, META_FILE)) as f:
+                    saved_meta = json.load(f)
+                if saved_meta == meta:
+                    index = faiss.read_index(os.path.join(index_dir, INDEX_FILE))
+                    node_ids = np.load(os.path.join(index_dir, IDS_FILE))
+                    logger.info(f"✓ Loaded ANN index ({index.ntotal} sections)")
+                    return cls(index, node_ids)
+                logger.info("ANN index is out of date, rebuilding...")
+            except FileNotFoundError:
+                logger.info("No saved ANN index, building...")
+            
+            ann_index = cls.build(driver)
+            ann_index.save(meta)
+            return ann_index
+    
+    @classmethod
+    def build(cls, driver) -> "SectionAnnIndex":
+        """
+        Build the index from the embeddings stored on Section nodes
+        
+        Args:
+            driver: Neo4j driver
+            
+        Returns:
+            SectionAnnIndex
+        """
+        records, _, _ = driver.execute_query(EMBEDDINGS_QUERY, database_=config.NEO4J_DATABASE)
+        
+        node_ids = np.array([record['node_id'] for record in records])
+        embeddings = np.empty((len(records), config.EMBEDDING_DIMENSION), dtype=np.float32)
+        for i, record in enumerate(records):
+            embeddings[i] = record['embedding']
+        del records
+        
+        embeddings = l2_normalize(embeddings)
+        
+        if config.ANN_INDEX_QUANTIZATION == "int8":
+            # int8 storage; queries stay float32 (asymmetric distance)
+            index = faiss.IndexHNSWSQ(
+                config.EMBEDDING_DIMENSION, faiss.ScalarQuantizer.QT_8bit,
+                config.ANN_HNSW_M, faiss.METRIC_INNER_PRODUCT
+            )
+            index.train(embeddings)
+        else:
+            index = faiss.IndexHNSWFlat(config.EMBEDDING_DIMENSION, config.ANN_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        
+        index.hnsw.efConstruction = config.ANN_HNSW_EF_CONSTRUCTION
+        index.add(embeddings)
+        
+        logger.info(f"✓ Built ANN index ({index.ntotal} sections)")
+        return cls(index, node_ids)
+    
+    def save(self, meta: dict):
+        """
+        Save the index, node ids and build metadata
+        
+        Args:
+            meta: Embedding model and section count the index was built from
+        """
+        index_dir = _index_dir()
+        os.makedirs(index_dir, exist_ok=True)
+        
+        # Write to temp files and rename into place, metadata last, so an
+        # interrupted save never leaves a matching meta.json over partial files
+        index_path = os.path.join(index_dir, INDEX_FILE)
+        faiss.write_index(self.index, index_path + ".tmp")
+        os.replace(index_path + ".tmp", index_path)
+        
+        ids_path = os.path.join(index_dir, IDS_FILE)
+        with open(ids_path + ".tmp", 'wb') as f:
+            np.save(f, self.node_ids)
+        os.replace(ids_path + ".tmp", ids_path)
+        
+        meta_path = os.path.join(index_dir, META_FILE)
+        with open(meta_path + ".tmp", 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + ".tmp", meta_path)
+    
+    def search(self, query_embedding: np.ndarray, top_k: int) -> List[Tuple[str, float]]:
+        """
+        Find the nearest sections
+        
+        Args:
+            query_embedding: Unit-length query embedding
+            top_k: Number of results
+            
+        Returns:
+            (node_id, score) pairs, best first. Scores use the Neo4j cosine
+            scale, (1 + cosine) / 2, so similarity thresholds carry over.
+        """
+        scores, rows = self.index.search(np.array(query_embedding, dtype=np.float32).reshape(1, -1), top_k)
+        return [
+            (str(self.node_ids[row]), (1.0 + float(score)) / 2.0)
+            for score, row in zip(scores[0], rows[0])
+            if row >= 0
+        ]
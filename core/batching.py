@@ -0,0 +1,118 @@
+"""
+Dynamic Batching Module
+Coalesces concurrent model calls into a single batched call
+"""
+
+import asyncio
+import logging
+from concurrent.futures import Executor
+from typing import Any, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Queues work from concurrent requests and runs it as one batch
+    
+    A background task waits for the first request, then keeps collecting
+    requests until either max_batch requests are queued or max_wait_ms has
+    passed. All items are concatenated, passed to batch_fn in a worker thread
+    (so the event loop stays free), and the results are split back per request.
+    """
+    
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]],
+                 max_batch: int = 32, max_wait_ms: float = 75,
+                 executor: Optional[Executor] = None):
+        """
+        Initialize batcher
+        
+        Args:
+            batch_fn: Sync function mapping a list of items to a list of results
+            max_batch: Max number of requests merged into one call
+            max_wait_ms: Max time to wait for more requests after the first
+            executor: Executor to run batch_fn in (default: asyncio's thread pool)
+        """
+        self.batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.executor = executor
+        
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    def _ensure_worker(self):
+        """Start the background task on the running loop (restart if the loop changed)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+    
+    async def submit(self, items: List[Any]) -> List[Any]:
+        """
+        Submit items and wait for their results
+        
+        Args:
+            items: Items for batch_fn
+            
+        Returns:
+            Results for these items, in order
+        """
+        if not items:
+            return []
+        
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put((items, future))
+        return await future
+    
+    async def _collect(self) -> List[Tuple[List[Any], asyncio.Future]]:
+        """Wait for one request, then gather more until the batch is full or time is up"""
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        
+        while len(batch) < self.max_batch:
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        
+        return batch
+    
+    async def _run(self):
+        """Background loop: collect, run one batched call, scatter results"""
+        while True:
+            batch = await self._collect()
+            all_items = [item for items, _ in batch for item in items]
+            
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Batching {len(batch)} requests ({len(all_items)} items)")
+            
+            try:
+                results = await self._loop.run_in_executor(self.executor, self.batch_fn, all_items)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            offset = 0
+            for items, future in batch:
+                if not future.done():
+                    future.set_result(list(results[offset:offset + len(items)]))
+                offset += len(items)
+    
+    async def close(self):
+        """Stop the background task"""
+        if self._worker is not None and not self._worker.done():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
@@ -3,6 +3,8 @@ Configuration file for Medical Knowledge Graph Chatbot
 Phase 2: Vector Search + Re-ranking + LLM Generation
 """
 
+import os
+
 # ============================================
 # NEO4J CONFIGURATION
 # ============================================
@@ -10,6 +12,9 @@ NEO4J_URI = "bolt://localhost:7687"
 NEO4J_USER = "neo4j"
 NEO4J_PASSWORD = "neo4j123"  # UPDATE THIS
 
+# Target database (naming it saves a home-database lookup round-trip per session)
+NEO4J_DATABASE = "neo4j"
+
 # ============================================
 # EMBEDDING MODEL CONFIGURATION
 # ============================================
@@ -20,18 +25,77 @@ EMBEDDING_DIMENSION = 384  # BGE-small dimension
 # Text to embed (Option C: Section text + entities)
 INCLUDE_ENTITIES_IN_EMBEDDING = True
 
+# Embedding model type: "sentence-transformers" (EMBEDDING_MODEL) or
+# "model2vec" (MODEL2VEC_MODEL, a static embedder ~100x faster on CPU at some
+# quality cost; the cross-encoder re-ranks its top-K as usual)
+# Indexing and queries both use it: re-index after changing it, and set
+# EMBEDDING_DIMENSION to the model's dimension (potion-base-8M: 256)
+EMBEDDING_MODEL_TYPE = "sentence-transformers"
+MODEL2VEC_MODEL = "minishlab/potion-base-8M"
+
+# Inference backend for the embedding model: "auto", "onnx", "openvino" or "torch"
+# "auto" uses "torch" when a CUDA GPU is available and "onnx" otherwise
+# ("openvino" int8 is often faster than ONNX int8 on CPUs without AVX512-VNNI)
+# Indexing and query encoding both use this, so re-index after changing it
+EMBEDDING_BACKEND = "auto"
+
+# Run the "torch" backend in fp16 on CUDA GPUs (negligible embedding drift)
+EMBEDDING_GPU_FP16 = True
+
+# ONNX model file to load. Missing files are exported automatically:
+#   "onnx/model_qint8_<arch>.onnx"  int8 dynamic quantization (arch: avx512_vnni, avx512, avx2, arm64)
+#   "onnx/model_O<1-4>.onnx"        graph optimizations (O3: attention/LayerNorm fusion, O4: O3 + fp16)
+EMBEDDING_ONNX_FILE = "onnx/model_qint8_avx512_vnni.onnx"
+
+# ONNX Runtime execution provider
+EMBEDDING_ONNX_PROVIDER = "CPUExecutionProvider"
+
+# OpenVINO model file to load (int8 static quantization, exported automatically)
+EMBEDDING_OPENVINO_FILE = "openvino/openvino_model_qint8_quantized.xml"
+
+# Where ONNX/OpenVINO files are exported if the model repo does not ship them
+EMBEDDING_EXPORT_DIR = "models/embedding"
+
 # ============================================
 # VECTOR SEARCH CONFIGURATION
 # ============================================
 # Number of sections to retrieve from vector search
 TOP_K_VECTOR_SEARCH = 10
 
+# Dynamic batching of query embeddings from concurrent API requests (async path only)
+QUERY_EMBED_MAX_BATCH = 32  # Max queries merged into one encode call
+QUERY_EMBED_BATCH_WAIT_MS = 15  # Max wait for more queries to arrive
+
+# Neo4j searches in flight at once for multi-query search (search_many)
+SEARCH_MANY_CONCURRENCY = 8
+
 # Vector index name in Neo4j
 VECTOR_INDEX_NAME = "section_embeddings"
 
+# In-process FAISS HNSW mirror of the section embeddings (needs faiss-cpu).
+# Searches without a substance pre-filter use it instead of the Neo4j vector
+# index; Neo4j still supplies section metadata and entities. Rebuilt from
+# Neo4j when the embedding model or section count changes.
+ANN_INDEX_ENABLED = False
+ANN_INDEX_DIR = "models/ann_index"
+ANN_HNSW_M = 32  # Graph neighbors per node
+ANN_HNSW_EF_CONSTRUCTION = 200  # Build-time search width
+ANN_HNSW_EF_SEARCH = 64  # Query-time search width (recall vs latency)
+ANN_INDEX_QUANTIZATION = "int8"  # "int8" (IndexHNSWSQ, 4x smaller) or None (float32)
+
 # Similarity metric (cosine is default for BGE)
 SIMILARITY_METRIC = "cosine"
 
+# Restrict vector search to substances named in the query
+PRE_FILTER_ENABLED = True
+
+# Minimum number of substances found in the query before filtering applies
+PRE_FILTER_MIN_ENTITIES = 1
+
+# Quantization of the vector index ("int8" or None for full precision)
+# int8 requires Neo4j 5.23+; an existing index must be dropped to change this
+EMBED_QUANTIZATION = "int8"
+
 # ============================================
 # CROSS-ENCODER CONFIGURATION
 # ============================================
@@ -41,19 +105,41 @@ CROSS_ENCODER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
 # Number of sections to keep after re-ranking
 TOP_N_RERANKED = 3
 
+# Max entities included in each re-ranking context
+# (also used to precompute Section.entities_joined at ingestion)
+PAIR_ENTITY_LIMIT = 20
+
+# Inference precision: "auto" (fp16 on GPU, fp32 on CPU), "fp16", "bf16" or "fp32"
+# bf16 only pays off on CPUs with native bf16 support (AVX512-BF16 / AMX)
+CROSS_ENCODER_PRECISION = "auto"
+
+# Compile the cross-encoder with torch.compile (falls back to eager on failure)
+CROSS_ENCODER_COMPILE = True
+
+# Dynamic batching of concurrent API requests (async path only)
+CROSS_ENCODER_MAX_BATCH = 32  # Max requests merged into one predict call
+CROSS_ENCODER_BATCH_WAIT_MS = 75  # Max wait for more requests to arrive
+
 # ============================================
 # OLLAMA CONFIGURATION
 # ============================================
 # Ollama model for answer generation
 OLLAMA_MODEL = "mistral:7b"
 
-# Ollama API endpoint
-OLLAMA_API_URL = "http://localhost:11434/api/generate"
+# Ollama chat endpoint (system prompt and question sent as separate messages)
+OLLAMA_CHAT_URL = "http://localhost:11434/api/chat"
 
 # Generation parameters
 OLLAMA_TEMPERATURE = 0.1  # Low temperature for factual responses
 OLLAMA_MAX_TOKENS = 1000
 
+# How long Ollama keeps the model loaded after a request (default is 5m)
+OLLAMA_KEEP_ALIVE = "30m"
+
+# Connection pool for the API's async Ollama client
+OLLAMA_MAX_KEEPALIVE_CONNECTIONS = 32
+OLLAMA_MAX_CONNECTIONS = 64
+
 # ============================================
 # PROMPT CONFIGURATION
 # ============================================
@@ -93,11 +179,53 @@ LOG_ALL_INTERACTIONS = True
 # ============================================
 # PERFORMANCE CONFIGURATION
 # ============================================
+# Intra-op threads for torch / ONNX Runtime model inference
+# (container defaults are often far off; 4-8 is usually optimal)
+TORCH_THREADS = min(os.cpu_count() or 1, 8)
+TORCH_INTEROP_THREADS = 2
+
 # Batch size for embedding generation (one-time setup)
 EMBEDDING_BATCH_SIZE = 32
 
-# Enable caching (set to False initially)
-ENABLE_CACHING = False
+# Sections streamed, embedded and written per chunk (one-time setup)
+EMBEDDING_CHUNK_SIZE = 512
+
+# Embeddings written to Neo4j per transaction (one-time setup)
+EMBEDDING_WRITE_BATCH_SIZE = 500
+
+# Embedding write transactions in flight at once (one-time setup)
+EMBEDDING_WRITE_CONCURRENCY = 8
+
+# Enable caching of query embeddings and cross-encoder scores
+ENABLE_CACHING = True
+
+# Max cached query embeddings (per process)
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+
+# Store cached query embeddings as int8 + per-vector scale (4x smaller in
+# the local and shared caches; cosine error is well under 1%)
+EMBEDDING_CACHE_INT8 = True
+
+# Max cached cross-encoder scores, keyed by (query, section node id)
+CROSS_ENCODER_CACHE_SIZE = 4096
+
+# Max cached vector search results, keyed by normalized query (per process)
+SEARCH_CACHE_SIZE = 512
+
+# Max cached LLM answers, keyed by (normalized query, re-ranked section ids)
+ANSWER_CACHE_SIZE = 512
+
+# Redis cache shared by API workers (None to disable), e.g. "redis://localhost:6379/0"
+REDIS_URL = None
+REDIS_CACHE_TTL = 86400  # Seconds
+REDIS_MAX_CONNECTIONS = 16  # Per worker process
+
+# ============================================
+# API SERVER CONFIGURATION
+# ============================================
+# Worker processes for `python backend/app.py` (each loads its own models;
+# set REDIS_URL so they share query/score caches)
+API_WORKERS = 1
 
 # ============================================
 # VALIDATION CONFIGURATION
@@ -105,5 +233,9 @@ ENABLE_CACHING = False
 # Minimum similarity score to consider a result relevant
 MIN_SIMILARITY_THRESHOLD = 0.3  # Lower = more permissive
 
-# Maximum context length (in characters) to send to LLM
+# Maximum context length (in characters) of a single section sent to LLM
 MAX_CONTEXT_LENGTH = 8000  # Ollama can handle much more, but keep it focused
+
+# Maximum context size (in tokens) sent to LLM
+# Counted with tiktoken if installed, otherwise estimated at ~4 chars/token
+MAX_CONTEXT_TOKENS = 2000
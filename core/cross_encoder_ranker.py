@@ -4,12 +4,25 @@ Re-ranks vector search results using cross-encoder for better relevance
 """
 
 import logging
-from typing import List, Dict, Tuple
-from sentence_transformers import CrossEncoder
+from collections import OrderedDict
+from typing import TYPE_CHECKING, List, Dict, Tuple, Optional
+import numpy as np
+from .batching import MicroBatcher
+from .embedding_backend import configure_threads
+from .shared_cache import get_shared_cache
 from . import config
 
+if TYPE_CHECKING:
+    import torch
+
 logger = logging.getLogger(__name__)
 
+# Enhanced context template (filled with format_map)
+PAIR_TEMPLATE = """Substance: {substance_name}
+Section: {section_name}
+Content: {section_text}
+Related Medical Terms: {entities}"""
+
 
 class CrossEncoderRanker:
     """Re-ranks search results using cross-encoder model"""
@@ -19,11 +32,89 @@ class CrossEncoderRanker:
         logger.info("Initializing Cross-Encoder Ranker...")
         logger.info(f"Loading model: {config.CROSS_ENCODER_MODEL}")
         
+        # Heavy ML imports are deferred until a ranker is actually built
+        configure_threads()
+        import torch
+        from sentence_transformers import CrossEncoder
+        
         # Load cross-encoder model
         self.cross_encoder = CrossEncoder(config.CROSS_ENCODER_MODEL)
         
+        # Tokenizer and per-section token ids, so section contexts are only
+        # built and tokenized once rather than on every query
+        self._tok = self.cross_encoder.tokenizer
+        self._max_length = min(
+            getattr(self.cross_encoder, 'max_length', None) or self._tok.model_max_length,
+            512
+        )
+        self._ctx_token_cache: Dict[str, List[int]] = {}
+        
+        # Lower precision + compiled graph for the forward pass
+        self._model = self._optimize_model()
+        
+        # Same activation CrossEncoder.predict applies to the logits
+        self._activation = getattr(self.cross_encoder, 'activation_fn', None)
+        if self._activation is None:
+            self._activation = getattr(self.cross_encoder, 'default_activation_function', None)
+        if self._activation is None:
+            self._activation = torch.nn.Identity()
+        
+        # LRU cache of scores keyed by (query, node_id), backed by the shared cache
+        self._score_cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self.shared_cache = get_shared_cache()
+        
+        # Merges predict calls from concurrent async requests
+        self.batcher = MicroBatcher(
+            self._predict_batch,
+            max_batch=config.CROSS_ENCODER_MAX_BATCH,
+            max_wait_ms=config.CROSS_ENCODER_BATCH_WAIT_MS
+        )
+        
         logger.info("✓ Cross-encoder ready")
     
+    def _optimize_model(self) -> "torch.nn.Module":
+        """
+        Cast the model to the configured precision and compile it
+        
+        Runs one warm-up forward pass so compilation happens at startup
+        rather than on the first user query.
+        
+        Returns:
+            Model to use for forward passes
+        """
+        import torch
+        
+        model = self.cross_encoder.model
+        device = next(model.parameters()).device
+        
+        precision = config.CROSS_ENCODER_PRECISION
+        if precision == "auto":
+            precision = "fp16" if device.type == "cuda" else "fp32"
+        
+        if precision == "fp16":
+            model.half()
+        elif precision == "bf16":
+            model.to(torch.bfloat16)
+        
+        logger.info(f"Cross-encoder precision: {precision} on {device.type}")
+        
+        warmup = self._tok("warmup query", "warmup context", return_tensors='pt').to(device)
+        
+        if config.CROSS_ENCODER_COMPILE and hasattr(torch, 'compile'):
+            compiled = torch.compile(model, mode="reduce-overhead", dynamic=True, fullgraph=False)
+            try:
+                with torch.inference_mode():
+                    compiled(**warmup)
+                logger.info("✓ Cross-encoder compiled")
+                return compiled
+            except Exception as e:
+                logger.warning(f"⚠ torch.compile failed, using eager model: {e}")
+        
+        with torch.inference_mode():
+            model(**warmup)
+        
+        return model
+    
     def prepare_pair(self, query: str, subgraph: Dict) -> str:
         """
         Prepare (query, context) pair for cross-encoder
@@ -39,57 +130,246 @@ class CrossEncoderRanker:
         """
         if config.ENHANCED_CONTEXT_FORMAT:
             # Enhanced format with metadata
-            entities_str = ', '.join(subgraph['entities'][:20])  # Limit entities
-            
-            context = f"""Substance: {subgraph['substance_name']}
-Section: {subgraph['section_name']}
-Content: {subgraph['section_text']}
-Related Medical Terms: {entities_str}"""
+            context = PAIR_TEMPLATE.format_map({
+                'substance_name': subgraph['substance_name'],
+                'section_name': subgraph['section_name'],
+                'section_text': subgraph['section_text'],
+                # Precomputed at ingestion; join on the fly for older graphs
+                'entities': (
+                    subgraph.get('entities_joined')
+                    or ', '.join(subgraph['entities'][:config.PAIR_ENTITY_LIMIT])
+                )
+            })
         else:
             # Simple format (just text)
             context = subgraph['section_text']
         
         return context
     
-    def rerank(self, query: str, subgraphs: List[Dict], top_n: int = None) -> List[Dict]:
+    def _lookup_local_scores(self, query: str, subgraphs: List[Dict]) -> Tuple[List[Optional[float]], List[int]]:
         """
-        Re-rank subgraphs using cross-encoder
+        Look up scores in the local LRU cache
+        
+        Returns:
+            (scores with None for cache misses, indices of the misses)
+        """
+        scores = [None] * len(subgraphs)
+        missing = []
+        
+        for i, subgraph in enumerate(subgraphs):
+            key = (query, subgraph['node_id'])
+            if config.ENABLE_CACHING and key in self._score_cache:
+                self._score_cache.move_to_end(key)
+                scores[i] = self._score_cache[key]
+            else:
+                missing.append(i)
+        
+        return scores, missing
+    
+    def _use_shared_scores(self, missing: List[int]) -> bool:
+        """Whether local misses should be looked up in the shared cache"""
+        return config.ENABLE_CACHING and bool(missing) and self.shared_cache.enabled
+    
+    def _merge_shared_scores(self, query: str, subgraphs: List[Dict], scores: List[Optional[float]],
+                             missing: List[int], shared: List[Optional[float]]) -> List[int]:
+        """Fill in scores computed by other workers; returns the indices still missing"""
+        still_missing = []
+        for i, score in zip(missing, shared):
+            if score is None:
+                still_missing.append(i)
+            else:
+                scores[i] = score
+                self._remember_score((query, subgraphs[i]['node_id']), score)
+        return still_missing
+    
+    def _lookup_scores(self, query: str, subgraphs: List[Dict]) -> Tuple[List[Optional[float]], List[int]]:
+        """
+        Look up cached cross-encoder scores (local, then shared cache)
+        
+        Returns:
+            (scores with None for cache misses, indices of the misses)
+        """
+        scores, missing = self._lookup_local_scores(query, subgraphs)
+        
+        # Fall back to scores computed by other workers
+        if self._use_shared_scores(missing):
+            shared = self.shared_cache.get_scores(query, [subgraphs[i]['node_id'] for i in missing])
+            missing = self._merge_shared_scores(query, subgraphs, scores, missing, shared)
+        
+        return scores, missing
+    
+    def _remember_score(self, key: Tuple[str, str], score: float):
+        """Add a score to the local LRU cache"""
+        self._score_cache[key] = score
+        if len(self._score_cache) > config.CROSS_ENCODER_CACHE_SIZE:
+            self._score_cache.popitem(last=False)
+    
+    def _store_scores(self, query: str, subgraphs: List[Dict], scores: List[Optional[float]],
+                      missing: List[int], fresh_scores) -> Dict[str, float]:
+        """
+        Merge freshly computed scores into scores and the local cache
+        
+        Returns:
+            Fresh scores by node id, for the shared cache
+        """
+        fresh = {}
+        for i, score in zip(missing, fresh_scores):
+            score = float(score)
+            scores[i] = score
+            
+            if config.ENABLE_CACHING:
+                self._remember_score((query, subgraphs[i]['node_id']), score)
+                fresh[subgraphs[i]['node_id']] = score
+        
+        return fresh
+    
+    def _context_ids(self, subgraph: Dict) -> List[int]:
+        """Token ids for a section context (cached per node_id)"""
+        node_id = subgraph['node_id']
+        ids = self._ctx_token_cache.get(node_id)
+        
+        if ids is None:
+            context = self.prepare_pair(None, subgraph)
+            ids = self._tok(
+                context,
+                add_special_tokens=False,
+                truncation=True,
+                max_length=self._max_length
+            )['input_ids']
+            
+            self._ctx_token_cache[node_id] = ids
+            if len(self._ctx_token_cache) > config.CROSS_ENCODER_CACHE_SIZE:
+                self._ctx_token_cache.pop(next(iter(self._ctx_token_cache)))
+        
+        return ids
+    
+    def _predict_batch(self, items: List[Tuple[str, Dict]], batch_size: int = 64) -> List[float]:
+        """
+        Score (query, subgraph) items with pre-tokenized inputs
+        
+        Queries are tokenized once per distinct query, contexts come from the
+        token cache; ids are joined with the model's special tokens and run
+        through the model in length-sorted batches.
+        
+        Args:
+            items: (query, subgraph) tuples, possibly from several requests
+            batch_size: Forward pass batch size
+            
+        Returns:
+            Scores aligned with items
+        """
+        import torch
+        
+        query_ids = {}
+        features = []
+        
+        for query, subgraph in items:
+            if query not in query_ids:
+                query_ids[query] = self._tok(
+                    query,
+                    add_special_tokens=False,
+                    truncation=True,
+                    max_length=self._max_length // 2
+                )['input_ids']
+            q_ids = query_ids[query]
+            
+            # Truncate the context so the pair fits in max_length
+            budget = self._max_length - len(q_ids) - self._tok.num_special_tokens_to_add(pair=True)
+            c_ids = self._context_ids(subgraph)[:max(budget, 0)]
+            
+            feature = {'input_ids': self._tok.build_inputs_with_special_tokens(q_ids, c_ids)}
+            if 'token_type_ids' in self._tok.model_input_names:
+                feature['token_type_ids'] = self._tok.create_token_type_ids_from_sequences(q_ids, c_ids)
+            features.append(feature)
+        
+        # Sort by length so each batch pads as little as possible
+        order = sorted(range(len(features)), key=lambda i: len(features[i]['input_ids']))
+        device = next(self.cross_encoder.model.parameters()).device
+        scores = [0.0] * len(features)
+        
+        with torch.inference_mode():
+            for start in range(0, len(order), batch_size):
+                batch_idx = order[start:start + batch_size]
+                batch = self._tok.pad(
+                    [features[i] for i in batch_idx],
+                    padding=True,
+                    return_tensors='pt'
+                ).to(device)
+                
+                logits = self._activation(self._model(**batch).logits.float())
+                if logits.shape[1] == 1:
+                    logits = logits[:, 0]
+                
+                for i, score in zip(batch_idx, logits.cpu().tolist()):
+                    scores[i] = score
+        
+        return scores
+    
+    def score(self, query: str, subgraphs: List[Dict]) -> List[float]:
+        """
+        Get cross-encoder scores for subgraphs
+        
+        Only cache misses go through the model, in a single batched call
         
         Args:
             query: User's question
-            subgraphs: List of subgraph contexts from vector search
-            top_n: Number of top results to return (default from config)
+            subgraphs: Subgraph contexts
             
         Returns:
-            Re-ranked subgraphs (top N)
+            Scores aligned with subgraphs
         """
-        if top_n is None:
-            top_n = config.TOP_N_RERANKED
+        scores, missing = self._lookup_scores(query, subgraphs)
         
-        if not subgraphs:
-            logger.warning("No subgraphs to rerank")
-            return []
+        if missing:
+            items = [(query, subgraphs[i]) for i in missing]
+            fresh_scores = self._predict_batch(items, batch_size=32)
+            fresh = self._store_scores(query, subgraphs, scores, missing, fresh_scores)
+            self.shared_cache.set_scores(query, fresh)
         
-        logger.info(f"Re-ranking {len(subgraphs)} results with cross-encoder...")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Cross-encoder cache hits: {len(subgraphs) - len(missing)}/{len(subgraphs)}")
         
-        # Prepare query-context pairs
-        pairs = []
-        for subgraph in subgraphs:
-            context = self.prepare_pair(query, subgraph)
-            pairs.append([query, context])
+        return scores
+    
+    async def ascore(self, query: str, subgraphs: List[Dict]) -> List[float]:
+        """
+        Async version of score()
         
-        # Get cross-encoder scores
-        scores = self.cross_encoder.predict(pairs)
+        Cache misses are queued on the batcher so concurrent requests share
+        one predict call; shared cache reads and writes run in worker threads
+        """
+        scores, missing = self._lookup_local_scores(query, subgraphs)
+        
+        # Fall back to scores computed by other workers
+        if self._use_shared_scores(missing):
+            shared = await self.shared_cache.aget_scores(query, [subgraphs[i]['node_id'] for i in missing])
+            missing = self._merge_shared_scores(query, subgraphs, scores, missing, shared)
         
+        if missing:
+            items = [(query, subgraphs[i]) for i in missing]
+            fresh_scores = await self.batcher.submit(items)
+            fresh = self._store_scores(query, subgraphs, scores, missing, fresh_scores)
+            await self.shared_cache.aset_scores(query, fresh)
+        
+        return scores
+    
+    def _select_top(self, subgraphs: List[Dict], scores: List[float], top_n: int) -> List[Dict]:
+        """Attach scores to subgraphs and keep the top N"""
         # Add cross-encoder scores to subgraphs
         for subgraph, score in zip(subgraphs, scores):
-            subgraph['cross_encoder_score'] = float(score)
+            subgraph['cross_encoder_score'] = score
         
-        # Sort by cross-encoder score (descending)
-        reranked = sorted(subgraphs, key=lambda x: x['cross_encoder_score'], reverse=True)
+        # Partial sort: pick the top N indices, then order only those (descending)
+        score_array = np.asarray(scores, dtype=np.float64)
+        top_n = min(top_n, len(score_array))
+        if top_n < len(score_array):
+            top_idx = np.argpartition(-score_array, top_n - 1)[:top_n]
+        else:
+            top_idx = np.arange(len(score_array))
+        top_idx = top_idx[np.argsort(-score_array[top_idx], kind='stable')]
         
         # Keep top N
-        top_reranked = reranked[:top_n]
+        top_reranked = [subgraphs[i] for i in top_idx]
         
         logger.info(f"✓ Re-ranked and selected top {len(top_reranked)} results")
         
@@ -104,6 +384,61 @@ Related Medical Terms: {entities_str}"""
         
         return top_reranked
     
+    def rerank(self, query: str, subgraphs: List[Dict], top_n: int = None) -> List[Dict]:
+        """
+        Re-rank subgraphs using cross-encoder
+        
+        Args:
+            query: User's question
+            subgraphs: List of subgraph contexts from vector search
+            top_n: Number of top results to return (default from config)
+            
+        Returns:
+            Re-ranked subgraphs (top N)
+        """
+        if top_n is None:
+            top_n = config.TOP_N_RERANKED
+        
+        if not subgraphs:
+            logger.warning("No subgraphs to rerank")
+            return []
+        
+        logger.info(f"Re-ranking {len(subgraphs)} results with cross-encoder...")
+        
+        # Get cross-encoder scores (cached where possible)
+        scores = self.score(query, subgraphs)
+        
+        return self._select_top(subgraphs, scores, top_n)
+    
+    async def arerank(self, query: str, subgraphs: List[Dict], top_n: int = None) -> List[Dict]:
+        """
+        Async version of rerank() using dynamic batching
+        
+        Args:
+            query: User's question
+            subgraphs: List of subgraph contexts from vector search
+            top_n: Number of top results to return (default from config)
+            
+        Returns:
+            Re-ranked subgraphs (top N)
+        """
+        if top_n is None:
+            top_n = config.TOP_N_RERANKED
+        
+        if not subgraphs:
+            logger.warning("No subgraphs to rerank")
+            return []
+        
+        logger.info(f"Re-ranking {len(subgraphs)} results with cross-encoder (batched)...")
+        
+        scores = await self.ascore(query, subgraphs)
+        
+        return self._select_top(subgraphs, scores, top_n)
+    
+    async def aclose(self):
+        """Stop the background batching task"""
+        await self.batcher.close()
+    
     def get_score_comparison(self, subgraphs_before: List[Dict], subgraphs_after: List[Dict]) -> Dict:
         """
         Compare rankings before and after re-ranking
@@ -124,12 +459,13 @@ Related Medical Terms: {entities_str}"""
             else False
         )
         
-        # Count how many results changed position
-        before_ids = [s['node_id'] for s in subgraphs_before[:config.TOP_N_RERANKED]]
-        after_ids = [s['node_id'] for s in subgraphs_after]
+        # Count how many results changed position (element-wise id comparison;
+        # results past the end of the "before" list always count as changed)
+        before_ids = np.array([s['node_id'] for s in subgraphs_before[:config.TOP_N_RERANKED]], dtype=object)
+        after_ids = np.array([s['node_id'] for s in subgraphs_after], dtype=object)
         
-        position_changes = sum(1 for i, node_id in enumerate(after_ids) 
-                              if i >= len(before_ids) or node_id != before_ids[i])
+        n = min(len(before_ids), len(after_ids))
+        position_changes = int((before_ids[:n] != after_ids[:n]).sum()) + (len(after_ids) - n)
         
         return {
             'top_result_changed': top_changed,
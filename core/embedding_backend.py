@@ -0,0 +1,278 @@
+"""
+Embedding Backend Module
+Loads the embedding model with the configured inference backend
+
+Both EmbeddingManager (indexing) and VectorSearcher (queries) load the model
+through here so section and query embeddings always come from the same runtime.
+"""
+
+import logging
+import os
+import re
+from functools import lru_cache
+from typing import List, Union
+import numpy as np
+from .file_lock import file_lock
+from .quantization import l2_normalize
+from . import config
+
+logger = logging.getLogger(__name__)
+
+# Project root (exported model paths in config are relative to it)
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class StaticEmbeddingModel:
+    """
+    Model2Vec static embedder behind the SentenceTransformer.encode() interface
+    
+    Static models look up and pool token vectors instead of running a
+    transformer, so encoding is orders of magnitude faster on CPU.
+    """
+    
+    def __init__(self, model_name: str):
+        """
+        Load a Model2Vec model
+        
+        Args:
+            model_name: Hugging Face id or local path of the model
+        """
+        from model2vec import StaticModel
+        
+        self.model = StaticModel.from_pretrained(model_name)
+    
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.model.dim
+    
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 1024,
+               show_progress_bar: bool = False, convert_to_numpy: bool = True,
+               normalize_embeddings: bool = False) -> np.ndarray:
+        """
+        Encode one text or a list of texts
+        
+        Args:
+            sentences: Text or list of texts
+            batch_size: Texts per batch
+            show_progress_bar: Show a progress bar
+            convert_to_numpy: Ignored (always returns numpy)
+            normalize_embeddings: L2-normalize each embedding
+            
+        Returns:
+            float32 embedding (1-D for a single text, 2-D for a list)
+        """
+        single = isinstance(sentences, str)
+        embeddings = self.model.encode(
+            [sentences] if single else sentences,
+            batch_size=batch_size,
+            show_progress_bar=show_progress_bar
+        ).astype(np.float32, copy=False)
+        
+        if normalize_embeddings:
+            embeddings = l2_normalize(embeddings)
+        
+        return embeddings[0] if single else embeddings
+
+
+def embedding_model_name() -> str:
+    """Name of the embedding model selected by EMBEDDING_MODEL_TYPE"""
+    if config.EMBEDDING_MODEL_TYPE == "model2vec":
+        return config.MODEL2VEC_MODEL
+    return config.EMBEDDING_MODEL
+
+
+@lru_cache(maxsize=None)
+def configure_threads():
+    """
+    Apply TORCH_THREADS / TORCH_INTEROP_THREADS and enable tokenizer parallelism
+    
+    Runs once per process, before sentence-transformers is imported.
+    """
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "true")
+    
+    try:
+        import torch
+    except ImportError:
+        return
+    
+    torch.set_num_threads(config.TORCH_THREADS)
+    try:
+        torch.set_num_interop_threads(config.TORCH_INTEROP_THREADS)
+    except RuntimeError:
+        # Can only be set before any inter-op parallel work has started
+        pass
+    
+    logger.info(f"Torch threads: {config.TORCH_THREADS} (inter-op: {config.TORCH_INTEROP_THREADS})")
+
+
+@lru_cache(maxsize=None)
+def _cuda_available() -> bool:
+    """Whether a CUDA GPU can be used (False if torch is not installed)"""
+    try:
+        import torch
+    except ImportError:
+        return False
+    return torch.cuda.is_available()
+
+
+def resolve_backend() -> str:
+    """
+    Concrete backend for config.EMBEDDING_BACKEND
+    
+    "auto" picks "torch" (fp16 on the GPU) when CUDA is available and
+    "onnx" (int8 on the CPU) otherwise.
+    """
+    if config.EMBEDDING_BACKEND == "auto":
+        return "torch" if _cuda_available() else "onnx"
+    return config.EMBEDDING_BACKEND
+
+
+def embedding_cache_key() -> str:
+    """Identifies the model and runtime that produce embeddings (for cache keys)"""
+    if config.EMBEDDING_MODEL_TYPE == "model2vec":
+        return f"model2vec:{config.MODEL2VEC_MODEL}"
+    
+    backend = resolve_backend()
+    files = {
+        "onnx": config.EMBEDDING_ONNX_FILE,
+        "openvino": config.EMBEDDING_OPENVINO_FILE,
+    }
+    return f"{config.EMBEDDING_MODEL}:{backend}:{files.get(backend, '')}"
+
+
+def _export_dir() -> str:
+    """Absolute directory for locally exported model variants"""
+    return os.path.join(PROJECT_ROOT, config.EMBEDDING_EXPORT_DIR)
+
+
+def _export_onnx_variant(export_dir: str):
+    """
+    Export the ONNX variant named by EMBEDDING_ONNX_FILE (one-time setup)
+    
+    Args:
+        export_dir: Directory to save the model and exported file in
+    """
+    from sentence_transformers import (
+        SentenceTransformer,
+        export_dynamic_quantized_onnx_model,
+        export_optimized_onnx_model,
+    )
+    
+    file_name = os.path.basename(config.EMBEDDING_ONNX_FILE)
+    quantized = re.match(r"model_qint8_(\w+)\.onnx$", file_name)
+    optimized = re.match(r"model_(O[1-4])\.onnx$", file_name)
+    if not (quantized or optimized):
+        raise ValueError(f"Don't know how to export ONNX file '{file_name}'")
+    
+    logger.info(f"Exporting {file_name} to {export_dir} (one-time)...")
+    
+    model = SentenceTransformer(config.EMBEDDING_MODEL, backend="onnx")
+    model.save(export_dir)
+    if quantized:
+        export_dynamic_quantized_onnx_model(model, quantized.group(1), export_dir)
+    else:
+        export_optimized_onnx_model(model, optimized.group(1), export_dir)
+    
+    logger.info(f"✓ Exported {file_name}")
+
+
+def _export_openvino_variant(export_dir: str):
+    """
+    Export the OpenVINO variant named by EMBEDDING_OPENVINO_FILE (one-time setup)
+    
+    Args:
+        export_dir: Directory to save the model and exported file in
+    """
+    from sentence_transformers import SentenceTransformer, export_static_quantized_openvino_model
+    
+    file_name = os.path.basename(config.EMBEDDING_OPENVINO_FILE)
+    if file_name != "openvino_model_qint8_quantized.xml":
+        raise ValueError(f"Don't know how to export OpenVINO file '{file_name}'")
+    
+    logger.info(f"Exporting {file_name} to {export_dir} (one-time, runs int8 calibration)...")
+    
+    model = SentenceTransformer(config.EMBEDDING_MODEL, backend="openvino")
+    model.save(export_dir)
+    export_static_quantized_openvino_model(model, None, export_dir)
+    
+    logger.info(f"✓ Exported {file_name}")
+
+
+def _session_options():
+    """ONNX Runtime session options: all graph optimizations, TORCH_THREADS intra-op threads"""
+    import onnxruntime as ort
+    
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = config.TORCH_THREADS
+    return options
+
+
+def load_embedding_model():
+    """
+    Load the embedding model for config.EMBEDDING_MODEL_TYPE / EMBEDDING_BACKEND
+    
+    "model2vec" loads MODEL2VEC_MODEL as a StaticEmbeddingModel. Otherwise
+    EMBEDDING_MODEL is loaded with sentence-transformers:
+    
+    "torch" loads the PyTorch model, in fp16 on a CUDA GPU when
+    EMBEDDING_GPU_FP16 is set. "onnx" and "openvino" load
+    EMBEDDING_ONNX_FILE / EMBEDDING_OPENVINO_FILE, first from the local export
+    directory, then from the model repo, and export it locally if neither
+    has it.
+    
+    Returns:
+        SentenceTransformer (or StaticEmbeddingModel)
+    """
+    if config.EMBEDDING_MODEL_TYPE == "model2vec":
+        logger.info(f"Embedding backend: model2vec ({config.MODEL2VEC_MODEL})")
+        return StaticEmbeddingModel(config.MODEL2VEC_MODEL)
+    
+    configure_threads()
+    from sentence_transformers import SentenceTransformer
+    
+    backend = resolve_backend()
+    logger.info(f"Embedding backend: {backend}")
+    
+    if backend == "torch":
+        if _cuda_available():
+            import torch
+            
+            model_kwargs = {"torch_dtype": torch.float16} if config.EMBEDDING_GPU_FP16 else {}
+            logger.info(f"Embedding device: cuda ({'fp16' if model_kwargs else 'fp32'})")
+            return SentenceTransformer(config.EMBEDDING_MODEL, device="cuda", model_kwargs=model_kwargs)
+        return SentenceTransformer(config.EMBEDDING_MODEL)
+    
+    if backend == "onnx":
+        file_name = config.EMBEDDING_ONNX_FILE
+        model_kwargs = {
+            "file_name": file_name,
+            "provider": config.EMBEDDING_ONNX_PROVIDER,
+            "session_options": _session_options(),
+        }
+        export = _export_onnx_variant
+    elif backend == "openvino":
+        file_name = config.EMBEDDING_OPENVINO_FILE
+        model_kwargs = {"file_name": file_name}
+        export = _export_openvino_variant
+    else:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}'")
+    
+    export_dir = _export_dir()
+    exported = os.path.join(export_dir, file_name)
+    # Held while checking for / writing the export, so API workers starting
+    # together never read a half-written export or export concurrently
+    lock_path = export_dir.rstrip(os.sep) + ".lock"
+    
+    with file_lock(lock_path):
+        if os.path.exists(exported):
+            return SentenceTransformer(export_dir, backend=backend, model_kwargs=model_kwargs)
+    
+    try:
+        return SentenceTransformer(config.EMBEDDING_MODEL, backend=backend, model_kwargs=model_kwargs)
+    except Exception as e:
+        logger.info(f"{file_name} not available from {config.EMBEDDING_MODEL}: {e}")
+    
+    with file_lock(lock_path):
+        if not os.path.exists(exported):
+            export(export_dir)
+    return SentenceTransformer(export_dir, backend=backend, model_kwargs=model_kwargs)
@@ -4,12 +4,15 @@ Generates embeddings for Section nodes and creates Neo4j vector index
 ONE-TIME SETUP: Run this after graph generation completes
 """
 
+import asyncio
 import logging
-from typing import List, Dict
-from neo4j import GraphDatabase
-from sentence_transformers import SentenceTransformer
+from itertools import islice
+from typing import Iterator, List, Dict
+from neo4j import AsyncDriver, AsyncGraphDatabase, GraphDatabase
 import numpy as np
 from tqdm import tqdm
+from .ann_index import remove_saved_index
+from .embedding_backend import embedding_model_name, load_embedding_model
 from . import config
 
 logger = logging.getLogger(__name__)
@@ -29,8 +32,8 @@ class EmbeddingManager:
         )
         
         # Load embedding model
-        logger.info(f"Loading embedding model: {config.EMBEDDING_MODEL}")
-        self.embedding_model = SentenceTransformer(config.EMBEDDING_MODEL)
+        logger.info(f"Loading embedding model: {embedding_model_name()}")
+        self.embedding_model = load_embedding_model()
         logger.info(f"✓ Model loaded (dimension: {config.EMBEDDING_DIMENSION})")
     
     def close(self):
@@ -38,94 +41,67 @@ class EmbeddingManager:
         if self.driver:
             self.driver.close()
     
-    def get_all_sections(self) -> List[Dict]:
+    def count_sections(self) -> int:
         """
-        Retrieve all Section nodes from Neo4j
+        Count Section nodes in Neo4j
         
         Returns:
-            List of section dictionaries with text and metadata
+            Number of sections
         """
-        with self.driver.session() as session:
-            query = """
-            MATCH (sec:Section)
-            RETURN sec.substance_name as substance_name,
-                   sec.name as section_name,
-                   sec.text as text,
-                   sec.entity_count as entity_count,
-                   elementId(sec) as node_id
-            """
-            result = session.run(query)
-            sections = []
-            
-            for record in result:
-                sections.append({
-                    'node_id': record['node_id'],
-                    'substance_name': record['substance_name'],
-                    'section_name': record['section_name'],
-                    'text': record['text'],
-                    'entity_count': record['entity_count'] or 0
-                })
-            
-            return sections
+        with self.driver.session(database=config.NEO4J_DATABASE) as session:
+            result = session.run("MATCH (sec:Section) RETURN count(sec) as count")
+            return result.single()['count']
     
-    def get_section_entities(self, substance_name: str, section_name: str) -> List[str]:
+    def get_all_sections(self, reuse_text: bool = False) -> Iterator[Dict]:
         """
-        Get entities mentioned in a specific section
+        Stream all Section nodes from Neo4j with their text to embed
+        
+        The embedding text (Option C: section text + entities) is built in
+        Cypher, so entities don't need a query or string join per section.
         
         Args:
-            substance_name: Name of substance
-            section_name: Name of section
-            
-        Returns:
-            List of entity names
+            reuse_text: Use Section.embed_text stored by a previous run where
+                present (skips the entity traversal for those sections)
+        
+        Yields:
+            Section dictionaries with node_id and embed_text
         """
-        with self.driver.session() as session:
+        with self.driver.session(database=config.NEO4J_DATABASE) as session:
             query = """
-            MATCH (sec:Section {substance_name: $substance_name, name: $section_name})
-                  -[:MENTIONS]->(e:Entity)
-            RETURN e.name as entity_name
+            MATCH (sec:Section)
+            OPTIONAL MATCH (sec)-[:MENTIONS]->(e:Entity)
+            WHERE NOT $reuse_text OR sec.embed_text IS NULL
+            WITH sec, collect(DISTINCT e.name) as entities
+            RETURN elementId(sec) as node_id,
+                   CASE
+                       WHEN $reuse_text AND sec.embed_text IS NOT NULL THEN sec.embed_text
+                       ELSE sec.text + CASE
+                           WHEN $include_entities AND size(entities) > 0
+                           THEN '\n\nKey medical terms: ' +
+                                reduce(acc = head(entities), name IN tail(entities) | acc + ', ' + name)
+                           ELSE ''
+                       END
+                   END as embed_text
             """
             result = session.run(
                 query,
-                substance_name=substance_name,
-                section_name=section_name
+                reuse_text=reuse_text,
+                include_entities=config.INCLUDE_ENTITIES_IN_EMBEDDING
             )
             
-            entities = [record['entity_name'] for record in result]
-            return entities
-    
-    def prepare_text_for_embedding(self, section: Dict) -> str:
-        """
-        Prepare text for embedding (Option C: section text + entities)
-        
-        Args:
-            section: Section dictionary
-            
-        Returns:
-            Text to embed
-        """
-        text = section['text']
-        
-        if config.INCLUDE_ENTITIES_IN_EMBEDDING and section['entity_count'] > 0:
-            # Get entities for this section
-            entities = self.get_section_entities(
-                section['substance_name'],
-                section['section_name']
-            )
-            
-            if entities:
-                # Append entities to text
-                entity_text = ', '.join(entities)
-                text = f"{text}\n\nKey medical terms: {entity_text}"
-        
-        return text
+            for record in result:
+                yield {
+                    'node_id': record['node_id'],
+                    'embed_text': record['embed_text']
+                }
     
-    def generate_embeddings_batch(self, texts: List[str]) -> np.ndarray:
+    def generate_embeddings_batch(self, texts: List[str], show_progress_bar: bool = False) -> np.ndarray:
         """
-        Generate embeddings for a batch of texts
+        Generate embeddings for a list of texts
         
         Args:
-            texts: List of texts to embed
+            texts: List of texts to embed (batched internally by EMBEDDING_BATCH_SIZE)
+            show_progress_bar: Show the encode progress bar
             
         Returns:
             Array of embeddings
@@ -133,30 +109,132 @@ class EmbeddingManager:
         embeddings = self.embedding_model.encode(
             texts,
             batch_size=config.EMBEDDING_BATCH_SIZE,
-            show_progress_bar=False,
+            show_progress_bar=show_progress_bar,
             convert_to_numpy=True,
             normalize_embeddings=True  # Important for cosine similarity
         )
         return embeddings
     
-    def store_embedding(self, node_id: str, embedding: np.ndarray):
+    @staticmethod
+    async def _write_embeddings(tx, rows: List[Dict]):
+        """Set embeddings (and the text they were built from) for a batch of sections in one transaction"""
+        # setNodeVectorProperty stores a float32 array instead of a list of
+        # 64-bit floats (half the store/page-cache size per vector)
+        query = """
+        UNWIND $rows AS row
+        MATCH (sec:Section)
+        WHERE elementId(sec) = row.id
+        SET sec.embed_text = row.text
+        WITH sec, row
+        CALL db.create.setNodeVectorProperty(sec, 'embedding', row.emb)
         """
-        Store embedding in Section node
+        result = await tx.run(query, rows=rows)
+        await result.consume()
+    
+    async def _store_batch(self, driver: AsyncDriver, semaphore: asyncio.Semaphore,
+                           sections: List[Dict], embeddings: np.ndarray):
+        """
+        Store one batch of embeddings, then release its write slot
         
         Args:
-            node_id: Neo4j node element ID
-            embedding: Embedding vector
+            driver: Async Neo4j driver
+            semaphore: Write slot acquired by the caller
+            sections: Section dictionaries (with node_id)
+            embeddings: Embedding vectors aligned with sections
+        """
+        try:
+            # Convert the whole (batch, dim) block to lists for Neo4j in one call
+            embedding_lists = embeddings.tolist()
+            rows = [
+                {'id': section['node_id'], 'text': section['embed_text'], 'emb': embedding}
+                for section, embedding in zip(sections, embedding_lists)
+            ]
+            async with driver.session(database=config.NEO4J_DATABASE) as session:
+                await session.execute_write(self._write_embeddings, rows)
+        finally:
+            semaphore.release()
+    
+    async def _embed_and_store(self, progress: tqdm, reuse_text: bool = False) -> int:
         """
-        with self.driver.session() as session:
-            # Convert numpy array to list for Neo4j
-            embedding_list = embedding.tolist()
+        Stream sections in chunks, embed them and write the embeddings
+        
+        Each chunk is read and encoded in worker threads while earlier write batches
+        (EMBEDDING_WRITE_BATCH_SIZE rows each) commit concurrently, up to
+        EMBEDDING_WRITE_CONCURRENCY at a time.
+        
+        Args:
+            progress: Progress bar to advance per chunk
+            reuse_text: Passed to get_all_sections()
+            
+        Returns:
+            Number of sections embedded
+        """
+        concurrency = config.EMBEDDING_WRITE_CONCURRENCY
+        batch_size = config.EMBEDDING_WRITE_BATCH_SIZE
+        
+        driver = AsyncGraphDatabase.driver(
+            config.NEO4J_URI,
+            auth=(config.NEO4J_USER, config.NEO4J_PASSWORD),
+            max_connection_pool_size=concurrency
+        )
+        semaphore = asyncio.Semaphore(concurrency)
+        writes = []
+        embedded = 0
+        
+        try:
+            sections = self.get_all_sections(reuse_text)
+            while True:
+                # Fetch the next chunk from Neo4j in a worker thread so
+                # in-flight write transactions keep running meanwhile
+                chunk = await asyncio.to_thread(
+                    lambda: list(islice(sections, config.EMBEDDING_CHUNK_SIZE))
+                )
+                if not chunk:
+                    break
+                
+                texts_to_embed = [section['embed_text'] for section in chunk]
+                embeddings = await asyncio.to_thread(self.generate_embeddings_batch, texts_to_embed)
+                
+                for i in range(0, len(chunk), batch_size):
+                    # Wait for a free write slot (bounds in-flight batches)
+                    await semaphore.acquire()
+                    writes.append(asyncio.create_task(self._store_batch(
+                        driver, semaphore, chunk[i:i + batch_size], embeddings[i:i + batch_size]
+                    )))
+                
+                embedded += len(chunk)
+                progress.update(len(chunk))
             
+            await asyncio.gather(*writes)
+        finally:
+            await driver.close()
+        
+        return embedded
+    
+    def store_entities_joined(self):
+        """
+        Precompute Section.entities_joined for re-ranking contexts
+        
+        Stores the first PAIR_ENTITY_LIMIT entity names (sorted, comma-joined)
+        on each Section so the re-ranker doesn't join them per query.
+        Safe to re-run on an existing graph.
+        """
+        with self.driver.session(database=config.NEO4J_DATABASE) as session:
             query = """
             MATCH (sec:Section)
-            WHERE elementId(sec) = $node_id
-            SET sec.embedding = $embedding
+            OPTIONAL MATCH (sec)-[:MENTIONS]->(e:Entity)
+            WITH sec, e
+            ORDER BY e.name
+            WITH sec, collect(DISTINCT e.name)[..$limit] AS entities
+            SET sec.entities_joined = CASE
+                WHEN size(entities) = 0 THEN ''
+                ELSE reduce(acc = head(entities), name IN tail(entities) | acc + ', ' + name)
+            END
+            RETURN count(sec) as updated
             """
-            session.run(query, node_id=node_id, embedding=embedding_list)
+            result = session.run(query, limit=config.PAIR_ENTITY_LIMIT)
+            updated = result.single()['updated']
+            logger.info(f"✓ Stored entities_joined on {updated} sections")
     
     def create_vector_index(self):
         """
@@ -164,7 +242,7 @@ class EmbeddingManager:
         
         NOTE: Requires Neo4j 5.x with vector index support
         """
-        with self.driver.session() as session:
+        with self.driver.session(database=config.NEO4J_DATABASE) as session:
             logger.info("Creating vector index...")
             
             # Check if index already exists
@@ -176,6 +254,11 @@ class EmbeddingManager:
                 logger.info(f"Vector index '{config.VECTOR_INDEX_NAME}' already exists")
                 return
             
+            # Scalar-quantize index vectors to int8 (4x less memory per ANN scan)
+            quantization = ""
+            if config.EMBED_QUANTIZATION == "int8":
+                quantization = ",\n                    `vector.quantization.enabled`: true"
+            
             # Create vector index
             create_query = f"""
             CREATE VECTOR INDEX {config.VECTOR_INDEX_NAME} IF NOT EXISTS
@@ -184,85 +267,77 @@ class EmbeddingManager:
             OPTIONS {{
                 indexConfig: {{
                     `vector.dimensions`: {config.EMBEDDING_DIMENSION},
-                    `vector.similarity_function`: '{config.SIMILARITY_METRIC}'
+                    `vector.similarity_function`: '{config.SIMILARITY_METRIC}'{quantization}
                 }}
             }}
             """
             
             try:
                 session.run(create_query)
-                logger.info(f"✓ Created vector index: {config.VECTOR_INDEX_NAME}")
+                logger.info(f"✓ Created vector index: {config.VECTOR_INDEX_NAME} "
+                            f"(quantization: {config.EMBED_QUANTIZATION or 'none'})")
             except Exception as e:
                 logger.error(f"Failed to create vector index: {e}")
                 logger.error("Make sure you're using Neo4j 5.x with vector index support")
+                if config.EMBED_QUANTIZATION:
+                    logger.error("Index quantization needs Neo4j 5.23+; set EMBED_QUANTIZATION = None for older versions")
                 raise
     
-    def add_embeddings_to_graph(self):
+    def add_embeddings_to_graph(self, reuse_text: bool = False):
         """
         Main method: Add embeddings to all Section nodes
         
         This is the ONE-TIME SETUP that should be run after graph generation
+        
+        Args:
+            reuse_text: Re-embed from Section.embed_text stored by a previous
+                run (e.g. after switching embedding models)
         """
         logger.info("\n" + "="*80)
         logger.info("ADDING EMBEDDINGS TO SECTION NODES")
         logger.info("="*80)
         
-        # Step 1: Get all sections
-        logger.info("\n[Step 1] Retrieving Section nodes from Neo4j...")
-        sections = self.get_all_sections()
-        logger.info(f"✓ Found {len(sections)} sections")
+        # Step 1: Count sections
+        logger.info("\n[Step 1] Counting Section nodes in Neo4j...")
+        total_sections = self.count_sections()
+        logger.info(f"✓ Found {total_sections} sections")
         
-        if not sections:
+        if not total_sections:
             logger.error("No Section nodes found in database!")
             logger.error("Make sure you've run the graph generation pipeline first.")
             return
         
-        # Step 2: Prepare texts for embedding
-        logger.info("\n[Step 2] Preparing texts for embedding...")
-        texts_to_embed = []
-        
-        for section in tqdm(sections, desc="Preparing texts"):
-            text = self.prepare_text_for_embedding(section)
-            texts_to_embed.append(text)
-        
-        logger.info(f"✓ Prepared {len(texts_to_embed)} texts")
-        
-        # Step 3: Generate embeddings in batches
-        logger.info(f"\n[Step 3] Generating embeddings (batch size: {config.EMBEDDING_BATCH_SIZE})...")
-        
-        all_embeddings = []
-        for i in tqdm(range(0, len(texts_to_embed), config.EMBEDDING_BATCH_SIZE), desc="Generating embeddings"):
-            batch_texts = texts_to_embed[i:i + config.EMBEDDING_BATCH_SIZE]
-            batch_embeddings = self.generate_embeddings_batch(batch_texts)
-            all_embeddings.append(batch_embeddings)
+        # Steps 2-4: Stream sections (with embed text) in chunks -> embed -> store
+        # (keeps memory at one chunk instead of the whole corpus)
+        chunk_size = config.EMBEDDING_CHUNK_SIZE
+        logger.info(f"\n[Steps 2-4] Embedding and storing sections "
+                    f"(chunk size: {chunk_size}, batch size: {config.EMBEDDING_BATCH_SIZE}, "
+                    f"concurrent writes: {config.EMBEDDING_WRITE_CONCURRENCY})...")
         
-        # Concatenate all batches
-        all_embeddings = np.vstack(all_embeddings)
-        logger.info(f"✓ Generated {len(all_embeddings)} embeddings")
-        logger.info(f"  Embedding shape: {all_embeddings.shape}")
+        with tqdm(total=total_sections, desc="Embedding sections") as progress:
+            embedded = asyncio.run(self._embed_and_store(progress, reuse_text))
         
-        # Step 4: Store embeddings in Neo4j
-        logger.info("\n[Step 4] Storing embeddings in Neo4j...")
+        logger.info(f"✓ Embedded and stored {embedded} sections")
         
-        for section, embedding in tqdm(zip(sections, all_embeddings), 
-                                       total=len(sections), 
-                                       desc="Storing embeddings"):
-            self.store_embedding(section['node_id'], embedding)
+        # Saved ANN index (if any) no longer matches the stored embeddings
+        remove_saved_index()
         
-        logger.info("✓ All embeddings stored")
+        # Step 5: Precompute joined entity strings for re-ranking
+        logger.info("\n[Step 5] Storing joined entity strings...")
+        self.store_entities_joined()
         
-        # Step 5: Create vector index
-        logger.info("\n[Step 5] Creating vector index...")
+        # Step 6: Create vector index
+        logger.info("\n[Step 6] Creating vector index...")
         self.create_vector_index()
         
         # Final statistics
         logger.info("\n" + "="*80)
         logger.info("EMBEDDING SETUP COMPLETE")
         logger.info("="*80)
-        logger.info(f"Sections processed: {len(sections)}")
+        logger.info(f"Sections processed: {embedded}")
         logger.info(f"Embedding dimension: {config.EMBEDDING_DIMENSION}")
         logger.info(f"Vector index: {config.VECTOR_INDEX_NAME}")
-        logger.info(f"Model: {config.EMBEDDING_MODEL}")
+        logger.info(f"Model: {embedding_model_name()}")
         logger.info("\n✓ Your knowledge graph is now ready for vector search!")
     
     def verify_embeddings(self) -> Dict:
@@ -272,12 +347,13 @@ class EmbeddingManager:
         Returns:
             Statistics about embeddings
         """
-        with self.driver.session() as session:
+        with self.driver.session(database=config.NEO4J_DATABASE) as session:
             # Check how many sections have embeddings
             query = """
             MATCH (sec:Section)
             RETURN count(sec) as total_sections,
-                   count(sec.embedding) as sections_with_embeddings
+                   count(sec.embedding) as sections_with_embeddings,
+                   count(sec.embed_text) as sections_with_embed_text
             """
             result = session.run(query)
             record = result.single()
@@ -285,6 +361,7 @@ class EmbeddingManager:
             stats = {
                 'total_sections': record['total_sections'],
                 'sections_with_embeddings': record['sections_with_embeddings'],
+                'sections_with_embed_text': record['sections_with_embed_text'],
                 'missing_embeddings': record['total_sections'] - record['sections_with_embeddings']
             }
             
@@ -297,6 +374,10 @@ def main():
     
     parser = argparse.ArgumentParser(description='Add embeddings to Section nodes')
     parser.add_argument('--verify', action='store_true', help='Only verify embeddings, don\'t generate')
+    parser.add_argument('--entities-only', action='store_true',
+                        help='Only (re)compute Section.entities_joined on an existing graph')
+    parser.add_argument('--reuse-text', action='store_true',
+                        help='Re-embed from Section.embed_text saved by a previous run')
     
     args = parser.parse_args()
     
@@ -309,7 +390,10 @@ def main():
     manager = EmbeddingManager()
     
     try:
-        if args.verify:
+        if args.entities_only:
+            # One-shot migration for graphs embedded before entities_joined existed
+            manager.store_entities_joined()
+        elif args.verify:
             # Just verify
             logger.info("Verifying embeddings...")
             stats = manager.verify_embeddings()
@@ -319,6 +403,7 @@ def main():
             print("="*60)
             print(f"Total sections: {stats['total_sections']}")
             print(f"Sections with embeddings: {stats['sections_with_embeddings']}")
+            print(f"Sections with embed text: {stats['sections_with_embed_text']}")
             print(f"Missing embeddings: {stats['missing_embeddings']}")
             
             if stats['missing_embeddings'] == 0:
@@ -328,7 +413,7 @@ def main():
                 print("Run without --verify flag to generate embeddings")
         else:
             # Generate embeddings
-            manager.add_embeddings_to_graph()
+            manager.add_embeddings_to_graph(reuse_text=args.reuse_text)
             
             # Verify
             stats = manager.verify_embeddings()
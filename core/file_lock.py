@@ -0,0 +1,34 @@
+"""
+File Lock Module
+Inter-process lock for one-time setup work shared by API worker processes
+(model export, ANN index build)
+"""
+
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path: str):
+    """
+    Hold an exclusive lock on path (created if missing) for the with-block
+    
+    Without fcntl (Windows) this is a no-op, so run a single worker there.
+    
+    Args:
+        path: Lock file path
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
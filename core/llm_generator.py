@@ -5,12 +5,38 @@ Uses Ollama to generate natural language answers from retrieved context
 
 import logging
 import requests
+import httpx
+from requests.adapters import HTTPAdapter
 import json
-from typing import List, Dict
+from typing import AsyncIterator, Callable, Iterator, List, Dict, Optional
 from . import config
 
+try:
+    import tiktoken
+except ImportError:  # Optional dependency
+    tiktoken = None
+
 logger = logging.getLogger(__name__)
 
+# Static prompt parts around the per-request context and question (strict mode)
+# The system prompt is sent as its own chat message
+PROMPT_QUESTION = "\n\n" + "=" * 80 + "\n\nUser Question: "
+PROMPT_SUFFIX = """
+
+Instructions:
+- Answer using ONLY the information provided in the sources above
+- Mention which substance and section your answer comes from
+- If the information is not in the sources, clearly state this
+- Be helpful but never make up information
+
+Answer:"""
+
+# Separator between source blocks in the context
+CONTEXT_SEPARATOR = '\n' + '─' * 80 + '\n'
+
+# Rough characters per token, used when tiktoken is not installed
+CHARS_PER_TOKEN = 4
+
 
 class LLMGenerator:
     """Generates answers using Ollama LLM"""
@@ -19,11 +45,17 @@ class LLMGenerator:
         """Initialize LLM generator"""
         logger.info("Initializing LLM Generator...")
         logger.info(f"Ollama model: {config.OLLAMA_MODEL}")
-        logger.info(f"Ollama API: {config.OLLAMA_API_URL}")
+        logger.info(f"Ollama API: {config.OLLAMA_CHAT_URL}")
+        
+        # Pooled keep-alive session for the sync path (one TCP handshake, reused)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
         
         # Verify Ollama is running
         try:
-            response = requests.get("http://localhost:11434/api/tags", timeout=5)
+            response = self.session.get("http://localhost:11434/api/tags", timeout=5)
             if response.status_code == 200:
                 logger.info("✓ Ollama is running")
             else:
@@ -31,6 +63,104 @@ class LLMGenerator:
         except requests.exceptions.RequestException as e:
             logger.error(f"✗ Cannot connect to Ollama: {e}")
             logger.error("Make sure Ollama is running: 'ollama serve'")
+        
+        # Pooled async HTTP client for the API (opened at app startup)
+        self.async_client = None
+        
+        # Tokenizer for context truncation (approximates the Ollama model's)
+        self.tokenizer = None
+        if tiktoken is not None:
+            try:
+                self.tokenizer = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                logger.warning(f"⚠ Could not load tiktoken encoding, estimating tokens: {e}")
+    
+    def close(self):
+        """Close the sync HTTP session"""
+        self.session.close()
+    
+    def open_async_client(self) -> httpx.AsyncClient:
+        """
+        Create the pooled keep-alive client used by the async methods
+        
+        Returns:
+            The shared async client
+        """
+        if self.async_client is None:
+            self.async_client = httpx.AsyncClient(
+                timeout=120,
+                limits=httpx.Limits(
+                    max_keepalive_connections=config.OLLAMA_MAX_KEEPALIVE_CONNECTIONS,
+                    max_connections=config.OLLAMA_MAX_CONNECTIONS
+                )
+            )
+        return self.async_client
+    
+    def _get_async_client(self) -> httpx.AsyncClient:
+        """Get the shared async client, opening it on first use"""
+        return self.async_client or self.open_async_client()
+    
+    async def aclose(self):
+        """Close the async HTTP client"""
+        if self.async_client is not None:
+            await self.async_client.aclose()
+            self.async_client = None
+    
+    def warm_up(self):
+        """
+        Ask Ollama to load the model (a chat request without messages)
+        
+        Sent at pipeline startup and while retrieval is still running so the
+        model is in memory by the time the prompt arrives, and kept loaded
+        for OLLAMA_KEEP_ALIVE. Failures are only logged.
+        """
+        try:
+            self.session.post(
+                config.OLLAMA_CHAT_URL,
+                json={"model": config.OLLAMA_MODEL, "messages": [], "keep_alive": config.OLLAMA_KEEP_ALIVE},
+                timeout=120
+            )
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"⚠ Ollama warm-up failed: {e}")
+    
+    async def awarm_up(self):
+        """Async version of warm_up() using the pooled async client"""
+        try:
+            await self._get_async_client().post(
+                config.OLLAMA_CHAT_URL,
+                json={"model": config.OLLAMA_MODEL, "messages": [], "keep_alive": config.OLLAMA_KEEP_ALIVE}
+            )
+        except httpx.HTTPError as e:
+            logger.warning(f"⚠ Ollama warm-up failed: {e}")
+    
+    def count_tokens(self, text: str) -> int:
+        """
+        Count (or estimate) the tokens in text
+        
+        Args:
+            text: Text to count
+            
+        Returns:
+            Number of tokens
+        """
+        if self.tokenizer is not None:
+            return len(self.tokenizer.encode(text, disallowed_special=()))
+        return -(-len(text) // CHARS_PER_TOKEN)
+    
+    def truncate_to_tokens(self, text: str, max_tokens: int) -> str:
+        """
+        Cut text down to at most max_tokens tokens
+        
+        Args:
+            text: Text to truncate
+            max_tokens: Token budget
+            
+        Returns:
+            Truncated text
+        """
+        if self.tokenizer is not None:
+            return self.tokenizer.decode(self.tokenizer.encode(text, disallowed_special=())[:max_tokens])
+        return text[:max_tokens * CHARS_PER_TOKEN]
     
     def format_context(self, subgraphs: List[Dict]) -> str:
         """
@@ -45,35 +175,48 @@ class LLMGenerator:
             Formatted context string
         """
         formatted_contexts = []
+        budget = config.MAX_CONTEXT_TOKENS
+        separator_tokens = self.count_tokens(CONTEXT_SEPARATOR)
         
         for i, subgraph in enumerate(subgraphs, 1):
             # Enhanced format with metadata
             entities_str = ', '.join(subgraph['entities'][:15])  # Limit entities
             
+            # Cheap cap before tokenizing very long sections
+            section_text = subgraph['section_text'][:config.MAX_CONTEXT_LENGTH]
+            
             context_block = f"""[Source {i}]
 Substance: {subgraph['substance_name']}
 Section: {subgraph['section_name']}
 
 Content:
-{subgraph['section_text']}
+{section_text}
 
 Related Medical Terms: {entities_str}
 """
+            if formatted_contexts:
+                budget -= separator_tokens
+            
+            # Stop once the token budget is used up, cutting the last block short
+            block_tokens = self.count_tokens(context_block)
+            if block_tokens > budget:
+                if budget > 0:
+                    formatted_contexts.append(self.truncate_to_tokens(context_block, budget) + "\n...(truncated)")
+                logger.warning(f"Context truncated to {config.MAX_CONTEXT_TOKENS} tokens "
+                               f"at source {i} of {len(subgraphs)}")
+                break
+            
+            budget -= block_tokens
             formatted_contexts.append(context_block)
         
         # Join all contexts
-        full_context = '\n' + ('─' * 80) + '\n'.join(formatted_contexts)
-        
-        # Truncate if too long
-        if len(full_context) > config.MAX_CONTEXT_LENGTH:
-            logger.warning(f"Context truncated from {len(full_context)} to {config.MAX_CONTEXT_LENGTH} chars")
-            full_context = full_context[:config.MAX_CONTEXT_LENGTH] + "\n...(truncated)"
+        full_context = CONTEXT_SEPARATOR.join(formatted_contexts)
         
         return full_context
     
     def build_prompt(self, query: str, subgraphs: List[Dict]) -> str:
         """
-        Build complete prompt for LLM
+        Build the user message for the LLM (context + question)
         
         Uses strict mode (Option A) to prevent hallucination
         
@@ -82,126 +225,271 @@ Related Medical Terms: {entities_str}
             subgraphs: Re-ranked subgraph contexts
             
         Returns:
-            Complete prompt
+            User message content
         """
         # Format context
         context = self.format_context(subgraphs)
         
-        # Build prompt (strict mode)
-        prompt = f"""{config.SYSTEM_PROMPT}
-
-{context}
-
-{'='*80}
-
-User Question: {query}
-
-Instructions:
-- Answer using ONLY the information provided in the sources above
-- Mention which substance and section your answer comes from
-- If the information is not in the sources, clearly state this
-- Be helpful but never make up information
-
-Answer:"""
+        # Build prompt (strict mode) from the precomputed static parts
+        return ''.join([context, PROMPT_QUESTION, query, PROMPT_SUFFIX])
+    
+    def build_messages(self, query: str, subgraphs: List[Dict]) -> List[Dict]:
+        """
+        Build chat messages for LLM
+        
+        The system prompt is identical on every request, so Ollama can
+        reuse its already-evaluated tokens between queries.
+        
+        Args:
+            query: User's question
+            subgraphs: Re-ranked subgraph contexts
+            
+        Returns:
+            System and user messages
+        """
+        return [
+            {"role": "system", "content": config.SYSTEM_PROMPT},
+            {"role": "user", "content": self.build_prompt(query, subgraphs)}
+        ]
+    
+    def extract_sources(self, subgraphs: List[Dict]) -> List[Dict]:
+        """
+        Build source attribution entries from subgraphs
+        
+        Args:
+            subgraphs: Re-ranked subgraph contexts
+            
+        Returns:
+            List of source dictionaries
+        """
+        return [
+            {
+                'substance_name': sg['substance_name'],
+                'section_name': sg['section_name'],
+                'similarity_score': sg['similarity_score'],
+                'cross_encoder_score': sg.get('cross_encoder_score', 0.0)
+            }
+            for sg in subgraphs
+        ]
+    
+    def _build_payload(self, query: str, subgraphs: List[Dict], stream: bool = False) -> Dict:
+        """
+        Build the Ollama request payload
         
-        return prompt
+        Args:
+            query: User's question
+            subgraphs: Re-ranked subgraph contexts
+            stream: Whether Ollama should stream the response
+            
+        Returns:
+            JSON payload for the Ollama API
+        """
+        # Build messages
+        messages = self.build_messages(query, subgraphs)
+        
+        # Log prompt in debug mode
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Prompt:\n{messages[1]['content']}")
+        
+        return {
+            "model": config.OLLAMA_MODEL,
+            "messages": messages,
+            "stream": stream,
+            "keep_alive": config.OLLAMA_KEEP_ALIVE,
+            "options": {
+                "temperature": config.OLLAMA_TEMPERATURE,
+                "num_predict": config.OLLAMA_MAX_TOKENS
+            }
+        }
+    
+    def _error_result(self, error_msg: str, answer: str = "Error generating answer. Please try again.") -> Dict:
+        """Log an error and build the matching result"""
+        logger.error(error_msg)
+        return {
+            'answer': answer,
+            'sources': [],
+            'error': error_msg
+        }
+    
+    @staticmethod
+    def _message_content(chunk: Dict) -> str:
+        """Text of a parsed Ollama chat response (or stream chunk)"""
+        return chunk.get('message', {}).get('content', '')
+    
+    def _answer_result(self, answer: str, subgraphs: List[Dict]) -> Dict:
+        """Build the result from the generated answer text"""
+        answer = answer.strip()
+        
+        logger.info("✓ Answer generated")
+        
+        return {
+            'answer': answer,
+            'sources': self.extract_sources(subgraphs),
+            'error': None,
+            'model': config.OLLAMA_MODEL,
+            'temperature': config.OLLAMA_TEMPERATURE
+        }
     
-    def generate_answer(self, query: str, subgraphs: List[Dict]) -> Dict:
+    def _no_context_result(self) -> Dict:
+        """Result when there is nothing to answer from"""
+        return {
+            'answer': "I don't have any relevant information in my knowledge base to answer this question.",
+            'sources': [],
+            'error': None
+        }
+    
+    def generate_answer_stream(self, query: str, subgraphs: List[Dict]) -> Iterator[str]:
+        """
+        Generate an answer with Ollama, yielding text chunks as they arrive
+        
+        Args:
+            query: User's question
+            subgraphs: Re-ranked subgraph contexts
+            
+        Yields:
+            Answer text chunks
+        """
+        logger.info("Streaming answer from Ollama...")
+        
+        payload = self._build_payload(query, subgraphs, stream=True)
+        
+        with self.session.post(config.OLLAMA_CHAT_URL, json=payload, stream=True, timeout=120) as response:
+            if response.status_code != 200:
+                raise RuntimeError(f"Ollama API error: {response.status_code}")
+            
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                
+                chunk = json.loads(line)
+                token = self._message_content(chunk)
+                if token:
+                    yield token
+                
+                if chunk.get('done'):
+                    break
+        
+        logger.info("✓ Answer streamed")
+    
+    def generate_answer(self, query: str, subgraphs: List[Dict],
+                        on_token: Optional[Callable[[str], None]] = None) -> Dict:
         """
         Generate answer using Ollama
         
         Args:
             query: User's question
             subgraphs: Re-ranked subgraph contexts
+            on_token: If given, the answer is streamed and each text chunk is
+                passed to this callback as it arrives
             
         Returns:
             Dictionary with answer and metadata
         """
         if not subgraphs:
-            return {
-                'answer': "I don't have any relevant information in my knowledge base to answer this question.",
-                'sources': [],
-                'error': None
-            }
+            return self._no_context_result()
         
         logger.info("Generating answer with Ollama...")
         
-        # Build prompt
-        prompt = self.build_prompt(query, subgraphs)
-        
-        # Log prompt in debug mode
-        if logger.isEnabledFor(logging.DEBUG):
-            logger.debug(f"Prompt:\n{prompt}")
-        
         # Call Ollama API
         try:
-            payload = {
-                "model": config.OLLAMA_MODEL,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": config.OLLAMA_TEMPERATURE,
-                    "num_predict": config.OLLAMA_MAX_TOKENS
-                }
-            }
+            if on_token is not None:
+                tokens = []
+                for token in self.generate_answer_stream(query, subgraphs):
+                    tokens.append(token)
+                    on_token(token)
+                return self._answer_result(''.join(tokens), subgraphs)
+            
+            payload = self._build_payload(query, subgraphs)
             
-            response = requests.post(
-                config.OLLAMA_API_URL,
+            response = self.session.post(
+                config.OLLAMA_CHAT_URL,
                 json=payload,
                 timeout=120  # 2 minute timeout
             )
             
             if response.status_code != 200:
-                error_msg = f"Ollama API error: {response.status_code}"
-                logger.error(error_msg)
-                return {
-                    'answer': "Error generating answer. Please try again.",
-                    'sources': [],
-                    'error': error_msg
-                }
+                return self._error_result(f"Ollama API error: {response.status_code}")
             
             # Parse response
-            result = response.json()
-            answer = result.get('response', '').strip()
+            return self._answer_result(self._message_content(response.json()), subgraphs)
+        
+        except requests.exceptions.Timeout:
+            return self._error_result(
+                "Ollama request timed out",
+                "Answer generation timed out. Please try again with a simpler question."
+            )
+        
+        except Exception as e:
+            return self._error_result(f"Error calling Ollama: {e}")
+    
+    async def agenerate_answer(self, query: str, subgraphs: List[Dict]) -> Dict:
+        """
+        Async version of generate_answer() using the pooled async client
+        
+        Args:
+            query: User's question
+            subgraphs: Re-ranked subgraph contexts
             
-            # Extract sources
-            sources = [
-                {
-                    'substance_name': sg['substance_name'],
-                    'section_name': sg['section_name'],
-                    'similarity_score': sg['similarity_score'],
-                    'cross_encoder_score': sg.get('cross_encoder_score', 0.0)
-                }
-                for sg in subgraphs
-            ]
+        Returns:
+            Dictionary with answer and metadata
+        """
+        if not subgraphs:
+            return self._no_context_result()
+        
+        logger.info("Generating answer with Ollama...")
+        
+        try:
+            payload = self._build_payload(query, subgraphs)
             
-            logger.info("✓ Answer generated")
+            response = await self._get_async_client().post(config.OLLAMA_CHAT_URL, json=payload)
             
-            return {
-                'answer': answer,
-                'sources': sources,
-                'error': None,
-                'model': config.OLLAMA_MODEL,
-                'temperature': config.OLLAMA_TEMPERATURE
-            }
+            if response.status_code != 200:
+                return self._error_result(f"Ollama API error: {response.status_code}")
+            
+            return self._answer_result(self._message_content(response.json()), subgraphs)
         
-        except requests.exceptions.Timeout:
-            error_msg = "Ollama request timed out"
-            logger.error(error_msg)
-            return {
-                'answer': "Answer generation timed out. Please try again with a simpler question.",
-                'sources': [],
-                'error': error_msg
-            }
+        except httpx.TimeoutException:
+            return self._error_result(
+                "Ollama request timed out",
+                "Answer generation timed out. Please try again with a simpler question."
+            )
         
         except Exception as e:
-            error_msg = f"Error calling Ollama: {e}"
-            logger.error(error_msg)
-            return {
-                'answer': "Error generating answer. Please try again.",
-                'sources': [],
-                'error': error_msg
-            }
+            return self._error_result(f"Error calling Ollama: {e}")
+    
+    async def astream_answer(self, query: str, subgraphs: List[Dict]) -> AsyncIterator[str]:
+        """
+        Generate an answer with Ollama, yielding text chunks as they arrive
+        
+        Args:
+            query: User's question
+            subgraphs: Re-ranked subgraph contexts
+            
+        Yields:
+            Answer text chunks
+        """
+        logger.info("Streaming answer from Ollama...")
+        
+        payload = self._build_payload(query, subgraphs, stream=True)
+        
+        client = self._get_async_client()
+        async with client.stream("POST", config.OLLAMA_CHAT_URL, json=payload) as response:
+            if response.status_code != 200:
+                raise RuntimeError(f"Ollama API error: {response.status_code}")
+            
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                
+                chunk = json.loads(line)
+                token = self._message_content(chunk)
+                if token:
+                    yield token
+                
+                if chunk.get('done'):
+                    break
+        
+        logger.info("✓ Answer streamed")
     
     def format_answer_with_sources(self, result: Dict) -> str:
         """
@@ -0,0 +1,83 @@
+"""
+Embedding Post-processing Module
+L2 normalization and int8 packing of embedding matrices and vectors
+
+L2 normalization uses a numba-compiled parallel loop when numba is
+installed (one pass per row, no temporary arrays), and plain numpy otherwise.
+"""
+
+from typing import Tuple
+import numpy as np
+
+try:
+    from numba import njit, prange
+except ImportError:  # Optional dependency
+    njit = None
+
+# Largest int8 magnitude used when packing embeddings
+INT8_SCALE = 127.0
+
+
+def _l2_normalize_numpy(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _l2_normalize_numba(x):
+        out = np.empty_like(x)
+        for i in prange(x.shape[0]):
+            norm = 0.0
+            for j in range(x.shape[1]):
+                norm += x[i, j] * x[i, j]
+            scale = 1.0 / max(np.sqrt(norm), 1e-12)
+            for j in range(x.shape[1]):
+                out[i, j] = x[i, j] * scale
+        return out
+    
+    _l2_normalize = _l2_normalize_numba
+else:
+    _l2_normalize = _l2_normalize_numpy
+
+
+def l2_normalize(embeddings: np.ndarray) -> np.ndarray:
+    """
+    L2-normalize each row of an embedding matrix
+    
+    Args:
+        embeddings: (N, D) embeddings
+        
+    Returns:
+        (N, D) float32 unit-length embeddings
+    """
+    return _l2_normalize(np.ascontiguousarray(embeddings, dtype=np.float32))
+
+
+def quantize_int8(embedding: np.ndarray) -> Tuple[np.ndarray, float]:
+    """
+    Pack one embedding to int8 with its own scale (max |value| / INT8_SCALE)
+    
+    Args:
+        embedding: (D,) embedding
+        
+    Returns:
+        (D,) int8 values and the float scale to multiply them by
+    """
+    embedding = np.asarray(embedding, dtype=np.float32)
+    scale = max(float(np.abs(embedding).max()), 1e-12) / INT8_SCALE
+    return np.rint(embedding / scale).astype(np.int8), scale
+
+
+def dequantize_int8(values: np.ndarray, scale: float) -> np.ndarray:
+    """
+    Unpack an embedding packed by quantize_int8()
+    
+    Args:
+        values: (D,) int8 values
+        scale: Scale returned with them
+        
+    Returns:
+        (D,) float32 embedding
+    """
+    return values.astype(np.float32) * np.float32(scale)
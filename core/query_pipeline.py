@@ -3,10 +3,13 @@ Query Pipeline
 Orchestrates the complete query flow: Vector Search → Re-ranking → LLM Generation
 """
 
+import asyncio
 import logging
 import time
-from typing import Dict
-from .vector_search import VectorSearcher
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+from .vector_search import VectorSearcher, normalize_query
 from .cross_encoder_ranker import CrossEncoderRanker
 from .llm_generator import LLMGenerator
 from . import config
@@ -23,10 +26,21 @@ class QueryPipeline:
         logger.info("INITIALIZING QUERY PIPELINE")
         logger.info("="*80)
         
-        # Initialize components
+        # Background work (Ollama model preload / warm-up)
+        self.pool = ThreadPoolExecutor(max_workers=2)
+        
+        # Initialize components; Ollama loads its model while the
+        # embedding and cross-encoder models load here
+        self.llm_generator = LLMGenerator()
+        self.pool.submit(self.llm_generator.warm_up)
         self.vector_searcher = VectorSearcher()
         self.reranker = CrossEncoderRanker()
-        self.llm_generator = LLMGenerator()
+        
+        # Per-instance LRU caches for repeated questions:
+        #   normalized query -> vector search results
+        #   (normalized query, re-ranked node ids) -> LLM result
+        self._search_cache: "OrderedDict[str, List[Dict]]" = OrderedDict()
+        self._answer_cache: "OrderedDict[Tuple[str, Tuple[str, ...]], Dict]" = OrderedDict()
         
         logger.info("="*80)
         logger.info("✓ QUERY PIPELINE READY")
@@ -34,15 +48,127 @@ class QueryPipeline:
     
     def close(self):
         """Close connections"""
+        self.pool.shutdown(wait=False)
         self.vector_searcher.close()
+        self.llm_generator.close()
+    
+    async def aclose(self):
+        """Stop background tasks and clients used by the async path"""
+        await self.vector_searcher.aclose()
+        await self.reranker.aclose()
+        await self.llm_generator.aclose()
+    
+    @staticmethod
+    def _cache_put(cache: OrderedDict, key, value, maxsize: int):
+        """Add an entry to an LRU cache, evicting the oldest if full"""
+        cache[key] = value
+        if len(cache) > maxsize:
+            cache.popitem(last=False)
+    
+    def _cached_search(self, key: str) -> Optional[List[Dict]]:
+        """Get copies of cached search results, or None"""
+        if not config.ENABLE_CACHING or key not in self._search_cache:
+            return None
+        
+        self._search_cache.move_to_end(key)
+        return [dict(sg) for sg in self._search_cache[key]]
+    
+    def _remember_search(self, key: str, subgraphs: List[Dict]):
+        """Cache search results, keeping copies so re-ranking can annotate the originals"""
+        if config.ENABLE_CACHING:
+            self._cache_put(self._search_cache, key, [dict(sg) for sg in subgraphs], config.SEARCH_CACHE_SIZE)
+    
+    def _search(self, query: str) -> List[Dict]:
+        """
+        Vector search with subgraphs, cached per normalized query
+        
+        Args:
+            query: User's question
+            
+        Returns:
+            Subgraph contexts
+        """
+        key = normalize_query(query)
+        subgraphs = self._cached_search(key)
+        if subgraphs is None:
+            subgraphs = self.vector_searcher.search_with_subgraphs(
+                query,
+                top_k=config.TOP_K_VECTOR_SEARCH
+            )
+            self._remember_search(key, subgraphs)
+        return subgraphs
+    
+    async def _asearch(self, query: str) -> List[Dict]:
+        """Async version of _search() (query embeddings are batched across requests)"""
+        key = normalize_query(query)
+        subgraphs = self._cached_search(key)
+        if subgraphs is None:
+            subgraphs = await self.vector_searcher.asearch(
+                query,
+                top_k=config.TOP_K_VECTOR_SEARCH
+            )
+            self._remember_search(key, subgraphs)
+        return subgraphs
+    
+    def _answer_key(self, query: str, subgraphs: List[Dict]) -> Tuple[str, Tuple[str, ...]]:
+        """Answer cache key: the query plus the sections it is answered from"""
+        return (normalize_query(query), tuple(sg['node_id'] for sg in subgraphs))
+    
+    def _cached_answer(self, key) -> Optional[Dict]:
+        """Get a copy of a cached LLM result, or None"""
+        if not config.ENABLE_CACHING or key not in self._answer_cache:
+            return None
+        
+        self._answer_cache.move_to_end(key)
+        cached = self._answer_cache[key]
+        return {**cached, 'sources': [dict(source) for source in cached['sources']]}
+    
+    def _remember_answer(self, key, llm_result: Dict):
+        """Cache a successful LLM result"""
+        if config.ENABLE_CACHING and llm_result['error'] is None:
+            self._cache_put(self._answer_cache, key, llm_result, config.ANSWER_CACHE_SIZE)
+    
+    def _new_result(self, query: str) -> Dict:
+        """Empty result dictionary for a query"""
+        return {
+            'query': query,
+            'answer': None,
+            'sources': [],
+            'error': None,
+            'timing': {}
+        }
     
-    def process_query(self, query: str, verbose: bool = False) -> Dict:
+    def _print_search_results(self, subgraphs):
+        """Print top vector search results (verbose mode)"""
+        print(f"  ✓ Found {len(subgraphs)} sections")
+        for i, sg in enumerate(subgraphs[:3], 1):
+            print(f"    [{i}] {sg['substance_name']}.{sg['section_name']} (score: {sg['similarity_score']:.3f})")
+    
+    def _print_rerank_results(self, reranked_subgraphs):
+        """Print re-ranked results (verbose mode)"""
+        print(f"  ✓ Re-ranked to top {len(reranked_subgraphs)}")
+        for i, sg in enumerate(reranked_subgraphs, 1):
+            print(f"    [{i}] {sg['substance_name']}.{sg['section_name']} (cross-encoder: {sg['cross_encoder_score']:.3f})")
+    
+    def _print_timing(self, result: Dict):
+        """Print per-step timing (verbose mode)"""
+        print("\n" + "─"*80)
+        print("TIMING:")
+        print(f"  Vector Search: {result['timing'].get('vector_search', 0):.2f}s")
+        print(f"  Re-ranking: {result['timing'].get('reranking', 0):.2f}s")
+        print(f"  LLM Generation: {result['timing'].get('llm_generation', 0):.2f}s")
+        print(f"  TOTAL: {result['timing']['total']:.2f}s")
+    
+    def process_query(self, query: str, verbose: bool = False,
+                      on_token: Optional[Callable[[str], None]] = None) -> Dict:
         """
         Process a user query through the complete pipeline
         
         Args:
             query: User's question
             verbose: If True, print detailed progress
+            on_token: If given, the answer is streamed from Ollama and each
+                text chunk is passed to this callback as it arrives
             
         Returns:
             Dictionary with answer and metadata
@@ -55,13 +181,7 @@ class QueryPipeline:
             print("="*80)
             print(f"Query: {query}\n")
         
-        result = {
-            'query': query,
-            'answer': None,
-            'sources': [],
-            'error': None,
-            'timing': {}
-        }
+        result = self._new_result(query)
         
         try:
             # Step 1: Vector Search
@@ -69,10 +189,7 @@ class QueryPipeline:
                 print("[Step 1] Vector Search...")
             
             step1_start = time.time()
-            subgraphs = self.vector_searcher.search_with_subgraphs(
-                query,
-                top_k=config.TOP_K_VECTOR_SEARCH
-            )
+            subgraphs = self._search(query)
             result['timing']['vector_search'] = time.time() - step1_start
             
             if not subgraphs:
@@ -81,9 +198,10 @@ class QueryPipeline:
                 return result
             
             if verbose:
-                print(f"  ✓ Found {len(subgraphs)} sections")
-                for i, sg in enumerate(subgraphs[:3], 1):
-                    print(f"    [{i}] {sg['substance_name']}.{sg['section_name']} (score: {sg['similarity_score']:.3f})")
+                self._print_search_results(subgraphs)
+            
+            # Make sure the LLM is loaded while re-ranking runs
+            warm_up = self.pool.submit(self.llm_generator.warm_up)
             
             # Step 2: Re-ranking
             if verbose:
@@ -98,16 +216,22 @@ class QueryPipeline:
             result['timing']['reranking'] = time.time() - step2_start
             
             if verbose:
-                print(f"  ✓ Re-ranked to top {len(reranked_subgraphs)}")
-                for i, sg in enumerate(reranked_subgraphs, 1):
-                    print(f"    [{i}] {sg['substance_name']}.{sg['section_name']} (cross-encoder: {sg['cross_encoder_score']:.3f})")
+                self._print_rerank_results(reranked_subgraphs)
             
             # Step 3: Generate Answer with LLM
             if verbose:
                 print("\n[Step 3] Generating Answer with Ollama...")
             
             step3_start = time.time()
-            llm_result = self.llm_generator.generate_answer(query, reranked_subgraphs)
+            warm_up.result()
+            answer_key = self._answer_key(query, reranked_subgraphs)
+            llm_result = self._cached_answer(answer_key)
+            if llm_result is not None:
+                if on_token is not None:
+                    on_token(llm_result['answer'])
+            else:
+                llm_result = self.llm_generator.generate_answer(query, reranked_subgraphs, on_token=on_token)
+                self._remember_answer(answer_key, llm_result)
             result['timing']['llm_generation'] = time.time() - step3_start
             
             # Merge results
@@ -130,15 +254,181 @@ class QueryPipeline:
         result['timing']['total'] = time.time() - start_time
         
         if verbose:
-            print("\n" + "─"*80)
-            print("TIMING:")
-            print(f"  Vector Search: {result['timing'].get('vector_search', 0):.2f}s")
-            print(f"  Re-ranking: {result['timing'].get('reranking', 0):.2f}s")
-            print(f"  LLM Generation: {result['timing'].get('llm_generation', 0):.2f}s")
-            print(f"  TOTAL: {result['timing']['total']:.2f}s")
+            self._print_timing(result)
         
         return result
     
+    async def _aretrieve(self, query: str, timing: Dict, verbose: bool = False) -> List[Dict]:
+        """
+        Run vector search and re-ranking (async path)
+        
+        Args:
+            query: User's question
+            timing: Dictionary to record step timings in
+            verbose: If True, print detailed progress
+            
+        Returns:
+            Re-ranked subgraphs (empty if nothing relevant was found)
+        """
+        # Step 1: Vector Search
+        if verbose:
+            print("[Step 1] Vector Search...")
+        
+        step1_start = time.time()
+        subgraphs = await self._asearch(query)
+        timing['vector_search'] = time.time() - step1_start
+        
+        if not subgraphs:
+            return []
+        
+        if verbose:
+            self._print_search_results(subgraphs)
+        
+        # Step 2: Re-ranking
+        if verbose:
+            print("\n[Step 2] Cross-Encoder Re-ranking...")
+        
+        # Make sure the LLM is loaded while re-ranking runs
+        warm_up = asyncio.create_task(self.llm_generator.awarm_up())
+        
+        step2_start = time.time()
+        reranked_subgraphs = await self.reranker.arerank(
+            query,
+            subgraphs,
+            top_n=config.TOP_N_RERANKED
+        )
+        timing['reranking'] = time.time() - step2_start
+        await warm_up
+        
+        if verbose:
+            self._print_rerank_results(reranked_subgraphs)
+        
+        return reranked_subgraphs
+    
+    async def aprocess_query(self, query: str, verbose: bool = False) -> Dict:
+        """
+        Async version of process_query() for the API
+        
+        Vector search runs in a worker thread and Ollama is called through a
+        pooled async client, so the event loop keeps serving other requests;
+        re-ranking goes through the batched cross-encoder so concurrent
+        requests share model calls.
+        
+        Args:
+            query: User's question
+            verbose: If True, print detailed progress
+            
+        Returns:
+            Dictionary with answer and metadata
+        """
+        start_time = time.time()
+        
+        if verbose:
+            print("\n" + "="*80)
+            print("PROCESSING QUERY")
+            print("="*80)
+            print(f"Query: {query}\n")
+        
+        result = self._new_result(query)
+        
+        try:
+            # Steps 1-2: Vector Search + Re-ranking
+            reranked_subgraphs = await self._aretrieve(query, result['timing'], verbose)
+            
+            if not reranked_subgraphs:
+                result['answer'] = "I couldn't find any relevant information in my knowledge base for this question."
+                result['timing']['total'] = time.time() - start_time
+                return result
+            
+            # Step 3: Generate Answer with LLM
+            if verbose:
+                print("\n[Step 3] Generating Answer with Ollama...")
+            
+            step3_start = time.time()
+            answer_key = self._answer_key(query, reranked_subgraphs)
+            llm_result = self._cached_answer(answer_key)
+            if llm_result is None:
+                llm_result = await self.llm_generator.agenerate_answer(query, reranked_subgraphs)
+                self._remember_answer(answer_key, llm_result)
+            result['timing']['llm_generation'] = time.time() - step3_start
+            
+            # Merge results
+            result['answer'] = llm_result['answer']
+            result['sources'] = llm_result['sources']
+            result['error'] = llm_result['error']
+            
+            if verbose:
+                if llm_result['error']:
+                    print(f"  ✗ Error: {llm_result['error']}")
+                else:
+                    print("  ✓ Answer generated")
+            
+        except Exception as e:
+            logger.error(f"Pipeline error: {e}", exc_info=True)
+            result['error'] = str(e)
+            result['answer'] = "An error occurred while processing your question. Please try again."
+        
+        # Total time
+        result['timing']['total'] = time.time() - start_time
+        
+        if verbose:
+            self._print_timing(result)
+        
+        return result
+    
+    async def astream_query(self, query: str) -> AsyncIterator[Dict]:
+        """
+        Process a query and stream the answer as it is generated
+        
+        Yields events:
+            {'sources': [...], 'timing_partial': {...}} once retrieval is done
+            {'token': '...'} for each generated chunk
+            {'done': True, 'timing': {...}, 'error': ...} at the end
+        
+        Args:
+            query: User's question
+        """
+        start_time = time.time()
+        timing = {}
+        error = None
+        
+        try:
+            reranked_subgraphs = await self._aretrieve(query, timing)
+            
+            yield {
+                'sources': self.llm_generator.extract_sources(reranked_subgraphs),
+                'timing_partial': dict(timing)
+            }
+            
+            if not reranked_subgraphs:
+                yield {'token': "I couldn't find any relevant information in my knowledge base for this question."}
+            else:
+                step3_start = time.time()
+                answer_key = self._answer_key(query, reranked_subgraphs)
+                cached = self._cached_answer(answer_key)
+                if cached is not None:
+                    yield {'token': cached['answer']}
+                else:
+                    tokens = []
+                    async for token in self.llm_generator.astream_answer(query, reranked_subgraphs):
+                        tokens.append(token)
+                        yield {'token': token}
+                    self._remember_answer(answer_key, {
+                        'answer': ''.join(tokens).strip(),
+                        'sources': self.llm_generator.extract_sources(reranked_subgraphs),
+                        'error': None,
+                        'model': config.OLLAMA_MODEL,
+                        'temperature': config.OLLAMA_TEMPERATURE
+                    })
+                timing['llm_generation'] = time.time() - step3_start
+        
+        except Exception as e:
+            logger.error(f"Pipeline error: {e}", exc_info=True)
+            error = str(e)
+        
+        timing['total'] = time.time() - start_time
+        yield {'done': True, 'timing': timing, 'error': error}
+    
     def format_result_for_display(self, result: Dict) -> str:
         """
         Format query result for display
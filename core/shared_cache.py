@@ -0,0 +1,190 @@
+"""
+Shared Cache Module
+Redis-backed cache for query embeddings and cross-encoder scores, shared
+across API worker processes
+"""
+
+import asyncio
+import hashlib
+import logging
+from typing import Dict, List, Optional
+import numpy as np
+from .embedding_backend import embedding_cache_key
+from .quantization import dequantize_int8, quantize_int8
+from . import config
+
+try:
+    import redis
+except ImportError:  # Optional dependency
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+def _digest(text: str) -> str:
+    """Short stable hash for use in Redis keys"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class SharedCache:
+    """
+    Best-effort Redis cache
+    
+    Every method degrades to a cache miss (or no-op) if Redis is not
+    configured, not installed, or unreachable, so callers never need to
+    handle Redis errors.
+    """
+    
+    def __init__(self):
+        """Connect to Redis if REDIS_URL is configured"""
+        self.client = None
+        
+        if not config.REDIS_URL:
+            return
+        
+        if redis is None:
+            logger.warning("⚠ REDIS_URL is set but the 'redis' package is not installed")
+            return
+        
+        pool = redis.BlockingConnectionPool.from_url(
+            config.REDIS_URL,
+            max_connections=config.REDIS_MAX_CONNECTIONS
+        )
+        self.client = redis.Redis(connection_pool=pool)
+        logger.info(f"✓ Shared cache enabled: {config.REDIS_URL}")
+    
+    @property
+    def enabled(self) -> bool:
+        return self.client is not None
+    
+    @staticmethod
+    def _embedding_key(query: str) -> str:
+        """Redis key for a query embedding (int8 and float32 entries don't mix)"""
+        prefix = "emb8" if config.EMBEDDING_CACHE_INT8 else "emb"
+        return f"{prefix}:{_digest(embedding_cache_key() + chr(0) + query)}"
+    
+    def get_embedding(self, query: str) -> Optional[np.ndarray]:
+        """
+        Get a cached query embedding
+        
+        Args:
+            query: Query text
+            
+        Returns:
+            Embedding, or None on a miss
+        """
+        if self.client is None:
+            return None
+        
+        try:
+            data = self.client.get(self._embedding_key(query))
+        except redis.RedisError as e:
+            logger.warning(f"⚠ Shared cache read failed: {e}")
+            return None
+        
+        if data is None:
+            return None
+        if config.EMBEDDING_CACHE_INT8:
+            # float32 scale followed by the int8 values
+            scale = float(np.frombuffer(data[:4], dtype=np.float32)[0])
+            return dequantize_int8(np.frombuffer(data[4:], dtype=np.int8), scale)
+        return np.frombuffer(data, dtype=np.float32)
+    
+    def set_embedding(self, query: str, embedding: np.ndarray):
+        """
+        Store a query embedding
+        
+        Args:
+            query: Query text
+            embedding: Embedding vector
+        """
+        if self.client is None:
+            return
+        
+        if config.EMBEDDING_CACHE_INT8:
+            values, scale = quantize_int8(embedding)
+            data = np.float32(scale).tobytes() + values.tobytes()
+        else:
+            data = np.asarray(embedding, dtype=np.float32).tobytes()
+        
+        try:
+            self.client.set(self._embedding_key(query), data, ex=config.REDIS_CACHE_TTL)
+        except redis.RedisError as e:
+            logger.warning(f"⚠ Shared cache write failed: {e}")
+    
+    async def aget_embedding(self, query: str) -> Optional[np.ndarray]:
+        """get_embedding() in a worker thread, so the event loop never waits on Redis"""
+        if self.client is None:
+            return None
+        return await asyncio.to_thread(self.get_embedding, query)
+    
+    @staticmethod
+    def _score_prefix(query: str) -> str:
+        """Redis key prefix for a query's cross-encoder scores (per model)"""
+        return f"ce:{_digest(config.CROSS_ENCODER_MODEL + chr(0) + query)}:"
+    
+    def get_scores(self, query: str, node_ids: List[str]) -> List[Optional[float]]:
+        """
+        Get cached cross-encoder scores
+        
+        Args:
+            query: Query text
+            node_ids: Section node ids
+            
+        Returns:
+            Scores aligned with node_ids (None for misses)
+        """
+        if self.client is None or not node_ids:
+            return [None] * len(node_ids)
+        
+        prefix = self._score_prefix(query)
+        try:
+            values = self.client.mget([prefix + node_id for node_id in node_ids])
+        except redis.RedisError as e:
+            logger.warning(f"⚠ Shared cache read failed: {e}")
+            return [None] * len(node_ids)
+        
+        return [float(v) if v is not None else None for v in values]
+    
+    def set_scores(self, query: str, scores: Dict[str, float]):
+        """
+        Store cross-encoder scores
+        
+        Args:
+            query: Query text
+            scores: Mapping of node id to score
+        """
+        if self.client is None or not scores:
+            return
+        
+        prefix = self._score_prefix(query)
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for node_id, score in scores.items():
+                pipe.set(prefix + node_id, repr(score), ex=config.REDIS_CACHE_TTL)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"⚠ Shared cache write failed: {e}")
+    
+    async def aget_scores(self, query: str, node_ids: List[str]) -> List[Optional[float]]:
+        """get_scores() in a worker thread, so the event loop never waits on Redis"""
+        if self.client is None or not node_ids:
+            return [None] * len(node_ids)
+        return await asyncio.to_thread(self.get_scores, query, node_ids)
+    
+    async def aset_scores(self, query: str, scores: Dict[str, float]):
+        """set_scores() in a worker thread, so the event loop never waits on Redis"""
+        if self.client is None or not scores:
+            return
+        await asyncio.to_thread(self.set_scores, query, scores)
+
+
+_shared_cache: Optional[SharedCache] = None
+
+
+def get_shared_cache() -> SharedCache:
+    """Get the process-wide shared cache"""
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = SharedCache()
+    return _shared_cache
@@ -3,14 +3,92 @@ Vector Search Module
 Queries Neo4j vector index to find similar Section nodes
 """
 
+import asyncio
 import logging
-from typing import List, Dict
-from neo4j import GraphDatabase
-from sentence_transformers import SentenceTransformer
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Dict, Optional, Tuple, Union
+import numpy as np
+from neo4j import GraphDatabase, RoutingControl
+from .ann_index import SectionAnnIndex
+from .batching import MicroBatcher
+from .embedding_backend import embedding_cache_key, embedding_model_name, load_embedding_model
+from .quantization import dequantize_int8, quantize_int8
+from .shared_cache import get_shared_cache
 from . import config
 
 logger = logging.getLogger(__name__)
 
+# Cypher queries (constant strings so Neo4j reuses their cached plans)
+SUBSTANCE_NAMES_QUERY = "MATCH (sec:Section) RETURN DISTINCT sec.substance_name as substance_name"
+
+SECTION_TEXT_QUERY = "MATCH (sec:Section) WHERE elementId(sec) = $node_id RETURN sec.text as text"
+
+# Entities come back in the same result (no query per section); columns are
+# aliased to the section dict keys so records convert with record.data().
+# Section text is cut to what the LLM context uses (get_section_text() has all of it)
+SEARCH_RETURN_CLAUSE = """
+OPTIONAL MATCH (node)-[:MENTIONS]->(e:Entity)
+WITH node, score, e
+ORDER BY e.name
+WITH node, score, collect(DISTINCT e.name) as entities
+RETURN elementId(node) as node_id,
+       node.substance_name as substance_name,
+       node.name as section_name,
+       left(node.text, $text_limit) as section_text,
+       node.word_count as word_count,
+       node.entity_count as entity_count,
+       entities,
+       node.entities_joined as entities_joined,
+       score as similarity_score
+ORDER BY similarity_score DESC
+"""
+
+# Approximate search over the vector index
+VECTOR_QUERY = """
+CALL db.index.vector.queryNodes(
+    $index_name,
+    $top_k,
+    $query_embedding
+)
+YIELD node, score
+WHERE score >= $min_score
+""" + SEARCH_RETURN_CLAUSE
+
+# ANN hits from the in-process index, hydrated from the graph
+ANN_HITS_QUERY = """
+UNWIND $hits AS hit
+MATCH (node:Section)
+WHERE elementId(node) = hit.node_id
+WITH node, hit.score AS score
+WHERE score >= $min_score
+""" + SEARCH_RETURN_CLAUSE
+
+# Pre-filter: exact similarity over the matching substances only
+FILTERED_VECTOR_QUERY = """
+MATCH (node:Section)
+WHERE node.substance_name IN $substances
+  AND node.embedding IS NOT NULL
+WITH node, vector.similarity.cosine(node.embedding, $query_embedding) AS score
+WHERE score >= $min_score
+WITH node, score
+ORDER BY score DESC
+LIMIT $top_k
+""" + SEARCH_RETURN_CLAUSE
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a query for embedding and cache lookups
+    
+    Lowercases and collapses whitespace; the embedding models are uncased,
+    so this doesn't change the embedding, only makes variants share cache entries.
+    """
+    return ' '.join(query.lower().split())
+
 
 class VectorSearcher:
     """Performs vector similarity search on Section nodes"""
@@ -25,42 +103,277 @@ class VectorSearcher:
             auth=(config.NEO4J_USER, config.NEO4J_PASSWORD)
         )
         
-        # Load embedding model (same as used for generation)
-        logger.info(f"Loading embedding model: {config.EMBEDDING_MODEL}")
-        self.embedding_model = SentenceTransformer(config.EMBEDDING_MODEL)
+        # Load embedding model (same model and backend as used for generation)
+        logger.info(f"Loading embedding model: {embedding_model_name()}")
+        self.embedding_model = load_embedding_model()
+        
+        # Single thread for all query encodes: callers wait on it without
+        # holding the GIL (the model releases it while computing), and model
+        # calls never compete with each other for TORCH_THREADS
+        self._encode_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="query-encode")
+        self._encode_pool.submit(self._warm_up).result()
+        
+        # Per-instance LRU cache of query embeddings, keyed by
+        # (model, normalized query) and backed by the shared cache;
+        # values are (int8 values, scale) when EMBEDDING_CACHE_INT8 is set
+        self.model_key = embedding_cache_key()
+        self.shared_cache = get_shared_cache()
+        self._embedding_cache: "OrderedDict[Tuple[str, str], Union[np.ndarray, Tuple[np.ndarray, float]]]" = OrderedDict()
+        # Written by the encode thread, read by callers on other threads
+        self._embedding_cache_lock = threading.Lock()
+        
+        # Merges query encodes from concurrent async requests
+        self.batcher = MicroBatcher(
+            self._encode_batch,
+            max_batch=config.QUERY_EMBED_MAX_BATCH,
+            max_wait_ms=config.QUERY_EMBED_BATCH_WAIT_MS,
+            executor=self._encode_pool
+        )
+        
+        # Optional in-process ANN index (replaces the Neo4j vector index
+        # for searches without a pre-filter)
+        self.ann_index = None
+        if config.ANN_INDEX_ENABLED:
+            self.ann_index = SectionAnnIndex.load_or_build(self.driver)
+        
+        # Substance names for metadata pre-filtering
+        self.substance_names = {}
+        self.substance_pattern = None
+        if config.PRE_FILTER_ENABLED:
+            self.substance_pattern = self._build_substance_pattern()
+        self.extract_substances = lru_cache(maxsize=1024)(self.extract_substances)
+        
         logger.info("✓ Vector searcher ready")
     
+    def _warm_up(self):
+        """
+        Run one dummy encode so the first user query doesn't pay for
+        session/kernel initialization and allocator warm-up (not cached)
+        """
+        self.embedding_model.encode(
+            ["warmup query"],
+            batch_size=1,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+        logger.info("✓ Embedding model warmed up")
+    
     def close(self):
-        """Close Neo4j connection"""
+        """Close Neo4j connection and the encode thread"""
+        self._encode_pool.shutdown(wait=False)
         if self.driver:
             self.driver.close()
     
-    def generate_query_embedding(self, query: str) -> List[float]:
+    async def aclose(self):
+        """Stop the query-embedding batcher"""
+        await self.batcher.close()
+    
+    def _build_substance_pattern(self) -> Optional["re.Pattern"]:
         """
-        Generate embedding for user query
+        Build a regex matching any known substance name
+        
+        Returns:
+            Compiled pattern, or None if no substances could be loaded
+        """
+        try:
+            records, _, _ = self.driver.execute_query(
+                SUBSTANCE_NAMES_QUERY,
+                database_=config.NEO4J_DATABASE,
+                routing_=RoutingControl.READ
+            )
+            names = [record['substance_name'] for record in records if record['substance_name']]
+        except Exception as e:
+            logger.warning(f"⚠ Could not load substance names, pre-filtering disabled: {e}")
+            return None
+        
+        if not names:
+            return None
+        
+        # Longest names first so "Green Tea Extract" wins over "Green Tea"
+        names.sort(key=len, reverse=True)
+        self.substance_names = {name.lower(): name for name in names}
+        
+        logger.info(f"✓ Pre-filtering enabled for {len(names)} substances")
+        return re.compile(r"(?<!\w)(" + "|".join(re.escape(name) for name in names) + r")(?!\w)", re.IGNORECASE)
+    
+    def extract_substances(self, query: str) -> List[str]:
+        """
+        Find substance names mentioned in a query
         
         Args:
             query: User's question
             
         Returns:
-            Query embedding as list
+            Substance names as stored in the graph (deduplicated)
         """
-        # Generate embedding (same model as sections)
-        embedding = self.embedding_model.encode(
-            query,
+        if self.substance_pattern is None:
+            return []
+        
+        found = []
+        for match in self.substance_pattern.findall(query):
+            name = self.substance_names[match.lower()]
+            if name not in found:
+                found.append(name)
+        
+        return found
+    
+    def _local_embedding(self, query: str) -> Optional[np.ndarray]:
+        """
+        Look up a normalized query's embedding in the local LRU cache
+        
+        Args:
+            query: Normalized query
+            
+        Returns:
+            Read-only embedding, or None on a miss
+        """
+        if not config.ENABLE_CACHING:
+            return None
+        
+        key = (self.model_key, query)
+        with self._embedding_cache_lock:
+            embedding = self._embedding_cache.get(key)
+            if embedding is None:
+                return None
+            self._embedding_cache.move_to_end(key)
+        
+        if config.EMBEDDING_CACHE_INT8:
+            embedding = dequantize_int8(*embedding)
+            embedding.flags.writeable = False
+        return embedding
+    
+    def _cached_embedding(self, query: str) -> Optional[np.ndarray]:
+        """
+        Look up a normalized query's embedding in the local, then the shared cache
+        
+        Args:
+            query: Normalized query
+            
+        Returns:
+            Read-only embedding, or None on a miss
+        """
+        embedding = self._local_embedding(query)
+        if embedding is None and config.ENABLE_CACHING:
+            embedding = self._remember_shared_embedding(query, self.shared_cache.get_embedding(query))
+        return embedding
+    
+    def _remember_shared_embedding(self, query: str, embedding: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        """Cache an embedding found in the shared cache locally (None passes through)"""
+        if embedding is not None:
+            embedding.flags.writeable = False
+            self._remember_embedding(query, embedding)
+        return embedding
+    
+    def _remember_embedding(self, query: str, embedding: np.ndarray):
+        """Add an embedding to the local LRU cache (as int8 + scale if EMBEDDING_CACHE_INT8)"""
+        if config.EMBEDDING_CACHE_INT8:
+            embedding = quantize_int8(embedding)
+        with self._embedding_cache_lock:
+            self._embedding_cache[(self.model_key, query)] = embedding
+            if len(self._embedding_cache) > config.QUERY_EMBEDDING_CACHE_SIZE:
+                self._embedding_cache.popitem(last=False)
+    
+    def _encode_batch(self, queries: List[str]) -> List[np.ndarray]:
+        """
+        Encode normalized queries in one model call and cache the results
+        
+        Args:
+            queries: Normalized queries
+            
+        Returns:
+            Read-only embeddings aligned with queries
+        """
+        # Generate embeddings (same model as sections); encode() sorts the
+        # batch by length internally so padding stays minimal
+        embeddings = self.embedding_model.encode(
+            queries,
+            batch_size=len(queries),
             convert_to_numpy=True,
             normalize_embeddings=True  # Important for cosine similarity
-        )
+        ).astype(np.float32, copy=False)  # fp16 models return float16
+        embeddings.flags.writeable = False  # Shared between cache hits
+        
+        if config.ENABLE_CACHING:
+            for query, embedding in zip(queries, embeddings):
+                self._remember_embedding(query, embedding)
+                self.shared_cache.set_embedding(query, embedding)
         
-        return embedding.tolist()
+        return list(embeddings)
     
-    def vector_search(self, query: str, top_k: int = None) -> List[Dict]:
+    def generate_query_embedding(self, query: str) -> np.ndarray:
+        """
+        Generate embedding for user query
+        
+        Args:
+            query: User's question
+            
+        Returns:
+            Read-only float32 unit-length query embedding
+        """
+        query = normalize_query(query)
+        embedding = self._cached_embedding(query)
+        if embedding is None:
+            embedding = self._encode_pool.submit(self._encode_batch, [query]).result()[0]
+        return embedding
+    
+    async def agenerate_query_embedding(self, query: str) -> np.ndarray:
+        """
+        Async version of generate_query_embedding()
+        
+        Cache misses from concurrent requests are encoded together in one
+        batched model call; the shared cache is read in a worker thread.
+        
+        Args:
+            query: User's question
+            
+        Returns:
+            Read-only float32 unit-length query embedding
+        """
+        query = normalize_query(query)
+        embedding = self._local_embedding(query)
+        if embedding is None and config.ENABLE_CACHING:
+            embedding = self._remember_shared_embedding(query, await self.shared_cache.aget_embedding(query))
+        if embedding is None:
+            embedding = (await self.batcher.submit([query]))[0]
+        return embedding
+    
+    def generate_query_embeddings(self, queries: List[str]) -> List[np.ndarray]:
+        """
+        Generate embeddings for several queries
+        
+        Cache misses are encoded together in one model call.
+        
+        Args:
+            queries: User questions
+            
+        Returns:
+            Read-only float32 unit-length embeddings aligned with queries
+        """
+        normalized = [normalize_query(query) for query in queries]
+        embeddings = [self._cached_embedding(query) for query in normalized]
+        
+        missing = list(dict.fromkeys(
+            query for query, embedding in zip(normalized, embeddings) if embedding is None
+        ))
+        if missing:
+            encoded = dict(zip(missing, self._encode_pool.submit(self._encode_batch, missing).result()))
+            embeddings = [
+                encoded[query] if embedding is None else embedding
+                for query, embedding in zip(normalized, embeddings)
+            ]
+        
+        return embeddings
+    
+    def vector_search(self, query: str, top_k: int = None, pre_filter: Dict = None,
+                      query_embedding: Optional[np.ndarray] = None) -> List[Dict]:
         """
         Perform vector similarity search
         
         Args:
             query: User's question
             top_k: Number of results to return (default from config)
+            pre_filter: Optional metadata filter, e.g. {'substances': [...]}
+            query_embedding: Precomputed query embedding (generated if not given)
             
         Returns:
             List of section results with similarity scores
@@ -68,81 +381,91 @@ class VectorSearcher:
         if top_k is None:
             top_k = config.TOP_K_VECTOR_SEARCH
         
-        logger.info(f"Vector search for: '{query}' (top {top_k})")
+        substances = (pre_filter or {}).get('substances')
+        
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f"Vector search for: '{query}' (top {top_k})")
         
         # Generate query embedding
-        query_embedding = self.generate_query_embedding(query)
+        if query_embedding is None:
+            query_embedding = self.generate_query_embedding(query)
         
         # Perform vector search in Neo4j
-        with self.driver.session() as session:
-            search_query = f"""
-            CALL db.index.vector.queryNodes(
-                $index_name,
-                $top_k,
-                $query_embedding
-            )
-            YIELD node, score
-            
-            RETURN node.substance_name as substance_name,
-                   node.name as section_name,
-                   node.text as section_text,
-                   node.word_count as word_count,
-                   node.entity_count as entity_count,
-                   score,
-                   elementId(node) as node_id
-            ORDER BY score DESC
-            """
+        return self._run_vector_search(query_embedding, top_k, substances)
+    
+    def _run_vector_search(self, query_embedding: np.ndarray, top_k: int,
+                           substances: Optional[List[str]], min_score: float = 0.0) -> List[Dict]:
+        """
+        Run the vector search query
+        
+        Args:
+            query_embedding: Query embedding
+            top_k: Number of results to return
+            substances: Substances to pre-filter on (None for the whole index)
+            min_score: Drop results scoring below this (in Cypher)
             
-            result = session.run(
-                search_query,
+        Returns:
+            List of section results with similarity scores
+        """
+        if substances and logger.isEnabledFor(logging.INFO):
+            logger.info(f"Pre-filtering on substances: {substances}")
+        
+        parameters = {
+            'min_score': min_score,
+            'text_limit': config.MAX_CONTEXT_LENGTH
+        }
+        
+        if substances:
+            query = FILTERED_VECTOR_QUERY
+            # The driver (5.0+) packs float32 ndarrays directly
+            parameters.update(query_embedding=query_embedding, top_k=top_k, substances=substances)
+        elif self.ann_index is not None:
+            query = ANN_HITS_QUERY
+            parameters['hits'] = [
+                {'node_id': node_id, 'score': score}
+                for node_id, score in self.ann_index.search(query_embedding, top_k)
+            ]
+        else:
+            query = VECTOR_QUERY
+            parameters.update(
                 index_name=config.VECTOR_INDEX_NAME,
-                top_k=top_k,
-                query_embedding=query_embedding
+                query_embedding=query_embedding,
+                top_k=top_k
             )
-            
-            sections = []
-            for record in result:
-                sections.append({
-                    'node_id': record['node_id'],
-                    'substance_name': record['substance_name'],
-                    'section_name': record['section_name'],
-                    'section_text': record['section_text'],
-                    'word_count': record['word_count'],
-                    'entity_count': record['entity_count'],
-                    'similarity_score': record['score']
-                })
-            
+        
+        records, _, _ = self.driver.execute_query(
+            query,
+            parameters_=parameters,
+            database_=config.NEO4J_DATABASE,
+            routing_=RoutingControl.READ
+        )
+        
+        sections = [record.data() for record in records]
+        
+        if logger.isEnabledFor(logging.INFO):
             logger.info(f"✓ Found {len(sections)} sections")
-            
-            return sections
+        
+        return sections
     
-    def get_section_entities(self, substance_name: str, section_name: str) -> List[str]:
+    def get_section_text(self, node_id: str) -> Optional[str]:
         """
-        Get entities mentioned in a section
+        Get the full text of a section
+        
+        Search results carry section text cut to MAX_CONTEXT_LENGTH
         
         Args:
-            substance_name: Name of substance
-            section_name: Name of section
+            node_id: Section element id (from search results)
             
         Returns:
-            List of entity names
-        """
-        with self.driver.session() as session:
-            query = """
-            MATCH (sec:Section {substance_name: $substance_name, name: $section_name})
-                  -[:MENTIONS]->(e:Entity)
-            RETURN e.name as entity_name,
-                   e.entity_type as entity_type
-            ORDER BY e.name
-            """
-            result = session.run(
-                query,
-                substance_name=substance_name,
-                section_name=section_name
-            )
-            
-            entities = [record['entity_name'] for record in result]
-            return entities
+            Section text, or None if the section doesn't exist
+        """
+        records, _, _ = self.driver.execute_query(
+            SECTION_TEXT_QUERY,
+            parameters_={'node_id': node_id},
+            database_=config.NEO4J_DATABASE,
+            routing_=RoutingControl.READ
+        )
+        return records[0]['text'] if records else None
     
     def build_subgraph_context(self, section: Dict) -> Dict:
         """
@@ -159,12 +482,6 @@ class VectorSearcher:
         Returns:
             Enhanced subgraph context
         """
-        # Get entities for this section
-        entities = self.get_section_entities(
-            section['substance_name'],
-            section['section_name']
-        )
-        
         # Build enhanced context
         subgraph = {
             'substance_name': section['substance_name'],
@@ -172,14 +489,16 @@ class VectorSearcher:
             'section_text': section['section_text'],
             'word_count': section['word_count'],
             'entity_count': section['entity_count'],
-            'entities': entities,
+            'entities': section['entities'],
+            'entities_joined': section.get('entities_joined'),
             'similarity_score': section['similarity_score'],
             'node_id': section['node_id']
         }
         
         return subgraph
     
-    def search_with_subgraphs(self, query: str, top_k: int = None) -> List[Dict]:
+    def search_with_subgraphs(self, query: str, top_k: int = None,
+                              query_embedding: Optional[np.ndarray] = None) -> List[Dict]:
         """
         Perform vector search and build subgraph contexts
         
@@ -188,15 +507,31 @@ class VectorSearcher:
         Args:
             query: User's question
             top_k: Number of results (default from config)
+            query_embedding: Precomputed query embedding (generated if not given)
             
         Returns:
             List of subgraph contexts with full information
         """
-        # Perform vector search
-        sections = self.vector_search(query, top_k)
+        # Pre-filter on substances mentioned in the query
+        pre_filter = None
+        substances = self.extract_substances(query)
+        if len(substances) >= config.PRE_FILTER_MIN_ENTITIES:
+            pre_filter = {'substances': substances}
+        
+        if top_k is None:
+            top_k = config.TOP_K_VECTOR_SEARCH
         
-        # Filter by minimum similarity threshold
-        sections = [s for s in sections if s['similarity_score'] >= config.MIN_SIMILARITY_THRESHOLD]
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f"Vector search for: '{query}' (top {top_k})")
+        
+        if query_embedding is None:
+            query_embedding = self.generate_query_embedding(query)
+        
+        # Vector search with entities in a single query
+        sections = self._run_vector_search(
+            query_embedding, top_k, (pre_filter or {}).get('substances'),
+            min_score=config.MIN_SIMILARITY_THRESHOLD
+        )
         
         if not sections:
             logger.warning(f"No sections found above similarity threshold {config.MIN_SIMILARITY_THRESHOLD}")
@@ -210,10 +545,53 @@ class VectorSearcher:
             subgraph = self.build_subgraph_context(section)
             subgraphs.append(subgraph)
         
-        logger.info(f"✓ Built {len(subgraphs)} subgraph contexts")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f"✓ Built {len(subgraphs)} subgraph contexts")
         
         return subgraphs
     
+    def search_many(self, queries: List[str], top_k: int = None) -> List[List[Dict]]:
+        """
+        search_with_subgraphs() for several queries
+        
+        All queries are embedded in one batched encode, then their Neo4j
+        searches run in parallel.
+        
+        Args:
+            queries: User questions
+            top_k: Number of results per query (default from config)
+            
+        Returns:
+            Subgraph contexts for each query, aligned with queries
+        """
+        if not queries:
+            return []
+        
+        embeddings = self.generate_query_embeddings(queries)
+        
+        with ThreadPoolExecutor(max_workers=min(len(queries), config.SEARCH_MANY_CONCURRENCY)) as pool:
+            return list(pool.map(
+                lambda query, embedding: self.search_with_subgraphs(query, top_k, embedding),
+                queries, embeddings
+            ))
+    
+    async def asearch(self, query: str, top_k: int = None) -> List[Dict]:
+        """
+        Async version of search_with_subgraphs()
+        
+        The query embedding goes through the batched encoder; Neo4j queries
+        run in a worker thread.
+        
+        Args:
+            query: User's question
+            top_k: Number of results (default from config)
+            
+        Returns:
+            List of subgraph contexts with full information
+        """
+        query_embedding = await self.agenerate_query_embedding(query)
+        return await asyncio.to_thread(self.search_with_subgraphs, query, top_k, query_embedding)
+    
     def format_subgraph_for_display(self, subgraph: Dict) -> str:
         """
         Format subgraph for human-readable display
@@ -224,9 +602,11 @@ class VectorSearcher:
         Returns:
             Formatted string
         """
-        entities_str = ', '.join(subgraph['entities'][:10])  # Limit to 10 entities
-        if len(subgraph['entities']) > 10:
-            entities_str += f" (and {len(subgraph['entities']) - 10} more)"
+        entities = subgraph['entities']
+        n = len(entities)
+        entities_str = ', '.join(entities[:10])  # Limit to 10 entities
+        if n > 10:
+            entities_str += f" (and {n - 10} more)"
         
         formatted = f"""
 Substance: {subgraph['substance_name']}
@@ -260,14 +640,14 @@ def test_vector_search():
         "Is it safe for people with liver problems?"
     ]
     
-    for query in test_queries:
+    # Search with subgraphs (queries embedded in one batch)
+    results = searcher.search_many(test_queries, top_k=3)
+    
+    for query, subgraphs in zip(test_queries, results):
         print(f"\n{'─'*80}")
         print(f"Query: {query}")
         print('─'*80)
         
-        # Search with subgraphs
-        subgraphs = searcher.search_with_subgraphs(query, top_k=3)
-        
         if not subgraphs:
             print("No results found")
             continue
@@ -1,6 +1,16 @@
 #!/bin/bash
 # Quick start script for backend API
+# By default runs uvicorn with config.API_WORKERS workers (uvloop + httptools).
+# Set WORKERS=N (N > 1) to run N workers under gunicorn instead. Each worker loads its own
+# models; set REDIS_URL in core/config.py so they share query/score caches.
+# Workers load the pipeline before they answer gunicorn's heartbeat, so the
+# worker timeout defaults to 600s (override with GUNICORN_TIMEOUT).
 
 cd "$(dirname "$0")/backend"
-python app.py
 
+if [ "${WORKERS:-1}" -gt 1 ]; then
+    exec gunicorn app:app -k uvicorn.workers.UvicornWorker -w "$WORKERS" -b 0.0.0.0:8000 \
+        --timeout "${GUNICORN_TIMEOUT:-600}"
+else
+    python app.py
+fi
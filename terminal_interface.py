@@ -3,7 +3,12 @@ Terminal Interface
 Interactive command-line chatbot for testing
 """
 
+import asyncio
 import logging
+import logging.handlers
+import queue
+import sys
+from typing import Dict
 from core.query_pipeline import QueryPipeline
 from core import config
 
@@ -18,18 +23,29 @@ class TerminalChatbot:
         print("="*80)
         print("\nInitializing...")
         
-        # Setup logging
+        # Setup logging: log calls only enqueue records; a background
+        # thread does the file/console I/O
+        log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+        file_handler = logging.FileHandler(config.LOG_FILE)
+        file_handler.setFormatter(log_formatter)
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(log_formatter)
+        
+        log_queue = queue.Queue(-1)
+        self.log_listener = logging.handlers.QueueListener(
+            log_queue, file_handler, stream_handler, respect_handler_level=True
+        )
+        self.log_listener.start()
+        
         logging.basicConfig(
             level=getattr(logging, config.LOG_LEVEL),
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(config.LOG_FILE),
-                logging.StreamHandler()
-            ]
+            handlers=[logging.handlers.QueueHandler(log_queue)]
         )
         
-        # Initialize pipeline
+        # Initialize pipeline; queries run on one long-lived event loop
         self.pipeline = QueryPipeline()
+        self.loop = asyncio.new_event_loop()
+        self.pipeline.llm_generator.open_async_client()
         self.query_count = 0
         
         print("\n✓ Chatbot ready!")
@@ -45,6 +61,26 @@ class TerminalChatbot:
         print("  - 'quit' or 'exit' - Exit chatbot")
         print("─"*80)
     
+    def _run_async(self, coro):
+        """
+        Run one pipeline coroutine on the chatbot's event loop
+        
+        The loop lives for the whole session, so the pipeline's background
+        work (Ollama warm-up, batched encodes, pooled HTTP client) carries
+        over between queries. On Ctrl+C the task is cancelled and the
+        KeyboardInterrupt re-raised to the input loop.
+        """
+        task = self.loop.create_task(coro)
+        try:
+            return self.loop.run_until_complete(task)
+        except KeyboardInterrupt:
+            task.cancel()
+            try:
+                self.loop.run_until_complete(task)
+            except (asyncio.CancelledError, Exception):
+                pass
+            raise
+    
     def run(self):
         """Run interactive chatbot loop"""
         verbose = False
@@ -88,13 +124,14 @@ class TerminalChatbot:
                 self.query_count += 1
                 print()  # Blank line
                 
-                result = self.pipeline.process_query(user_input, verbose=verbose)
-                
-                # Display result
-                if not verbose:
+                if verbose:
+                    # Step-by-step output, then the full answer
+                    result = self._run_async(self.pipeline.aprocess_query(user_input, verbose=True))
+                    print(f"Bot: {result['answer']}")
+                else:
+                    # Print the answer as it is generated
                     print("\n" + "─"*80)
-                
-                print(f"Bot: {result['answer']}")
+                    result = self._run_async(self._stream_answer(user_input))
                 
                 # Show sources if enabled
                 if config.INCLUDE_SOURCE_ATTRIBUTION and result['sources']:
@@ -122,10 +159,50 @@ class TerminalChatbot:
                 print(f"\n✗ Error: {e}")
                 logging.error(f"Chatbot error: {e}", exc_info=True)
     
+    async def _stream_answer(self, query: str) -> Dict:
+        """
+        Print the answer token by token as the pipeline streams it
+        
+        Args:
+            query: User's question
+            
+        Returns:
+            Result dictionary (answer, sources, timing, error) like process_query()
+        """
+        result = {'answer': '', 'sources': [], 'timing': {}, 'error': None}
+        tokens = []
+        
+        sys.stdout.write("Bot: ")
+        sys.stdout.flush()
+        
+        async for event in self.pipeline.astream_query(query):
+            if 'token' in event:
+                tokens.append(event['token'])
+                sys.stdout.write(event['token'])
+                sys.stdout.flush()
+            elif 'sources' in event:
+                result['sources'] = event['sources']
+            elif event.get('done'):
+                result['timing'] = event['timing']
+                result['error'] = event['error']
+        
+        result['answer'] = ''.join(tokens).strip()
+        if result['error'] and not tokens:
+            result['answer'] = "An error occurred while processing your question. Please try again."
+            sys.stdout.write(result['answer'])
+        print()
+        
+        return result
+    
     def close(self):
         """Close chatbot"""
+        self.loop.run_until_complete(self.pipeline.aclose())
+        self.loop.close()
         self.pipeline.close()
         print(f"\nTotal queries processed: {self.query_count}")
+        
+        # Flush remaining log records and stop the logging thread
+        self.log_listener.stop()
 
 
 def main():
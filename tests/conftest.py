@@ -0,0 +1,11 @@
+"""
+Test configuration
+Makes the project root importable (core, backend) when running pytest
+"""
+
+import os
+import sys
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
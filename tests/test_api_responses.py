@@ -0,0 +1,58 @@
+"""
+Response shape tests
+The unvalidated /query response must match the validated (pydantic) schema
+"""
+
+import msgspec
+import pytest
+from backend.api import schemas
+from backend.api.routes import build_query_response
+
+PIPELINE_RESULTS = [
+    # Full result
+    {
+        'query': 'Can pregnant women take asparagus?',
+        'answer': 'Asparagus is likely safe in food amounts during pregnancy.',
+        'sources': [
+            {
+                'substance_name': 'Asparagus',
+                'section_name': 'Safety',
+                'similarity_score': 0.91,
+                'cross_encoder_score': 7.25
+            },
+            {
+                'substance_name': 'Asparagus',
+                'section_name': 'Side Effects',
+                'similarity_score': 0.84,
+                'cross_encoder_score': 3.5
+            }
+        ],
+        'timing': {'vector_search': 0.05, 'reranking': 0.12, 'llm_generation': 1.8, 'total': 1.97},
+        'error': None
+    },
+    # Nothing retrieved: no sources, partial timing
+    {
+        'query': 'Unknown question',
+        'answer': "I couldn't find any relevant information in my knowledge base for this question.",
+        'sources': [],
+        'timing': {'vector_search': 0.04, 'total': 0.04},
+        'error': None
+    },
+    # Pipeline error: no answer, missing optional source scores
+    {
+        'query': 'Broken question',
+        'answer': None,
+        'sources': [{'substance_name': 'Asparagus', 'section_name': 'Safety'}],
+        'timing': {'total': 0.5},
+        'error': 'Connection refused'
+    },
+]
+
+
+@pytest.mark.parametrize("result", PIPELINE_RESULTS)
+def test_response_matches_validated_schema(result):
+    """Fast-path JSON has exactly the fields and values of the validated model"""
+    fast = msgspec.json.decode(msgspec.json.encode(build_query_response(result)))
+    validated = schemas.QueryResponse.model_validate(fast).model_dump(exclude_none=True)
+
+    assert fast == validated
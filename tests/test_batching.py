@@ -0,0 +1,58 @@
+"""
+MicroBatcher tests
+Batched calls must return the same results, per request, as unbatched ones
+"""
+
+import asyncio
+from core.batching import MicroBatcher
+
+
+def _square_rows(rows):
+    """Stand-in batch function: one output row per input row"""
+    return [[value * value for value in row] for row in rows]
+
+
+def test_batched_results_match_unbatched():
+    """Concurrent submits are merged but each gets its own results back, in order"""
+    requests = [
+        [[1, 2, 3]],
+        [[4, 5, 6], [7, 8, 9]],
+        [[10, 11, 12], [13, 14, 15], [16, 17, 18]],
+    ]
+    calls = []
+
+    def batch_fn(rows):
+        calls.append(len(rows))
+        return _square_rows(rows)
+
+    async def run():
+        batcher = MicroBatcher(batch_fn, max_batch=8, max_wait_ms=50)
+        try:
+            return await asyncio.gather(*(batcher.submit(rows) for rows in requests))
+        finally:
+            await batcher.close()
+
+    batched = asyncio.run(run())
+
+    assert batched == [_square_rows(rows) for rows in requests]
+    assert [len(result) for result in batched] == [len(rows) for rows in requests]
+    assert calls == [sum(len(rows) for rows in requests)]  # one merged call
+
+
+def test_batch_errors_reach_every_request():
+    """An exception in the batch function is raised to each waiting request"""
+    def batch_fn(rows):
+        raise ValueError("model failed")
+
+    async def run():
+        batcher = MicroBatcher(batch_fn, max_batch=8, max_wait_ms=10)
+        try:
+            return await asyncio.gather(
+                batcher.submit([[1]]), batcher.submit([[2]]), return_exceptions=True
+            )
+        finally:
+            await batcher.close()
+
+    results = asyncio.run(run())
+
+    assert all(isinstance(result, ValueError) for result in results)